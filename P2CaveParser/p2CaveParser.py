@@ -5,6 +5,10 @@
 #  the objects by categories.
 
 
+import concurrent.futures
+import mmap
+import os
+import re
 import P2CaveParser.constants as constants
 
 
@@ -14,6 +18,8 @@ class RawCave:
     ## Constructor.
     #  @param self Object pointer.
     def __init__(self):
+        # Number of sublevels, as declared in the CaveInfo block. (Parameter {c000}.)
+        self.sublevelTotal = 0
         # List of sublevels.
         self.sublevels = []
 
@@ -39,6 +45,16 @@ class RawSublevel:
 ## Raw data about a sublevel's parameters.
 class RawSublevelInfo:
 
+    # Fixed set of attributes, so that each object doesn't need a dict.
+    __slots__ = (
+        'sublevelNumberF000', 'sublevelNumberF001', 'mainObjectIdealMax',
+        'treasureObjectIdealMax', 'gateObjectIdealMax', 'roomUnits',
+        'corridorRoomRatio', 'hasGeyser', 'caveUnitListFilename',
+        'lightingFilename', 'skybox', 'hasClog', 'unknownF011', 'musicType',
+        'hasFloor', 'deadEndChance', 'fileFormat', 'waterwraithTime',
+        'hasSeesawBlocks',
+    )
+    
     ## Constructor.
     #  @param self Object pointer.
     def __init__(self):
@@ -85,6 +101,12 @@ class RawSublevelInfo:
 ## Raw data about an object entry in a sublevel.
 class RawObject:
     
+    # There are lots of these in a big batch of caves, so they use slots instead of a dict.
+    __slots__ = (
+        'objClass', 'carrying', 'spawnMethod', 'minAmount', 'weight',
+        'spawnType', 'capType',
+    )
+    
     ## Constructor.
     #  @param self Object pointer.
     def __init__(self):
@@ -107,6 +129,9 @@ class RawObject:
 ## Raw data about a gate entry.
 class RawGate:
     
+    # Slotted, like RawObject.
+    __slots__ = ('keyword', 'health', 'minAmount', 'weight')
+    
     ## Constructor.
     #  @param self Object pointer.
     def __init__(self):
@@ -120,224 +145,562 @@ class RawGate:
         self.weight = None
 
 
+## Types of tokens emitted by tokenizeCave().
+# Opening curly brace of a block.
+TOKEN_BLOCK_OPEN = 0
+# Closing curly brace of a block.
+TOKEN_BLOCK_CLOSE = 1
+# A "{fNNN} type value" line. The token value is a tuple with the key and the value string.
+TOKEN_KEY_VALUE = 2
+# The number of entries in a block. The token value is the number.
+TOKEN_COUNT = 3
+# A line belonging to an entry in a block. The token value is the cleaned line.
+TOKEN_ENTRY = 4
+# The {_eof} marker at the end of a key-value block.
+TOKEN_EOF = 5
+
+## Types of blocks in a cave file.
+BLOCK_CAVE_INFO = 0
+BLOCK_FLOOR_INFO = 1
+BLOCK_TEKI_INFO = 2
+BLOCK_ITEM_INFO = 3
+BLOCK_GATE_INFO = 4
+BLOCK_CAP_INFO = 5
+
+## Order in which each sublevel's blocks show up in the file, after the CaveInfo block.
+SUBLEVEL_BLOCKS = [
+    BLOCK_FLOOR_INFO,
+    BLOCK_TEKI_INFO,
+    BLOCK_ITEM_INFO,
+    BLOCK_GATE_INFO,
+    BLOCK_CAP_INFO,
+]
+
+
 ## Reads a cave file and returns a RawCave object filled with the cave's data.
 #  @param infile Input file.
+#  @param blocks Optional list of the blocks to read. Use BLOCK_*. The other
+#  blocks are skipped over, so their data is left empty. None to read them all.
+#  @return The parsed cave data.
+def parseCaveFromFile(infile, blocks=None):
+    return parseCaveFromTokens(tokenizeCave(infile, getSkippedBlocks(blocks)))
+
+
+## Reads a cave file by memory-mapping it, and returns a RawCave object filled
+#  with the cave's data. The file's bytes are scanned directly, and only the
+#  parts that are kept get decoded, so this skips decoding and copying the whole file.
+#  @param filename Name of the cave file.
+#  @param blocks Optional list of the blocks to read. Same as in parseCaveFromFile().
+#  @return The parsed cave data.
+def parseCaveFromMappedFile(filename, blocks=None):
+    skipBlocks = getSkippedBlocks(blocks)
+    with open(filename, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            # Empty files can't be mapped.
+            return parseCaveFromTokens(tokenizeCaveBytes(b'', skipBlocks))
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return parseCaveFromTokens(tokenizeCaveBytes(data, skipBlocks))
+
+
+## Builds a RawCave object out of a cave file's tokens.
+#  @param tokens Iterable of (token type, value) tuples, like the ones from tokenizeCave().
 #  @return The parsed cave data.
-def parseCaveFromFile(infile):
+def parseCaveFromTokens(tokens):
     caveData = RawCave()
+    caveData.sublevels.extend(readCaveTokens(tokens, caveData))
     
-    readCaveinfo(infile, caveData)
-    
-    for s in range(len(caveData.sublevels)):
-        readFloorinfo(infile, caveData, s)
-        readTekiinfo(infile, caveData, s)
-        readIteminfo(infile, caveData, s)
-        readGateinfo(infile, caveData, s)
-        readCapinfo(infile, caveData, s)
+    # If the file ends early, the missing sublevels are left blank.
+    while len(caveData.sublevels) < caveData.sublevelTotal:
+        caveData.sublevels.append(RawSublevel())
     
     return caveData
 
 
-## Reads the CaveInfo block in a text file and fills the cave data object.
+## Reads a cave file, and yields each sublevel's data as soon as all of its
+#  blocks are read. Unlike parseCaveFromFile(), the sublevels are not kept
+#  anywhere, so this is better for huge caves, or if only the first few
+#  sublevels are needed.
 #  @param infile Input file.
-#  @param caveData The RawCave cave data object to fill.
-def readCaveinfo(infile, caveData):
-    searchingStart = True
+#  @param blocks Optional list of the blocks to read. Same as in parseCaveFromFile().
+#  @return A generator of RawSublevel objects.
+def iterSublevels(infile, blocks=None):
+    return readCaveTokens(tokenizeCave(infile, getSkippedBlocks(blocks)), RawCave())
+
+
+## Opens a cave file by name, and returns a RawCave object filled with the cave's data.
+#  @param filename Name of the cave file.
+#  @return The parsed cave data.
+def parseCaveFromFilename(filename):
+    with open(filename, 'r', encoding='utf-8', errors='ignore') as infile:
+        return parseCaveFromFile(infile)
+
+
+## Reads all cave files in a directory, like the game's "caveinfo" folder, and
+#  returns their data. This covers story caves as well as challenge ('ch_')
+#  and battle ('vs_') caves. The files are parsed in parallel, by a pool of processes.
+#  @param path Path to the directory.
+#  @param workers Maximum number of processes to use. None to use one per CPU.
+#  1 parses everything in the current process instead.
+#  @param cache Optional RawCaveCache (from p2CaveParserCache) to read and write parsed caves from.
+#  @return A dictionary where each key is the cave's internal name (the file name
+#  sans extension), and each value is its RawCave object.
+def parseCaveDirectory(path, workers=None, cache=None):
+    names = []
+    filenames = []
+    for fn in sorted(os.listdir(path)):
+        fullFn = os.path.join(path, fn)
+        if not fn.lower().endswith('.txt') or not os.path.isfile(fullFn) : continue
+        names.append(fn[:-4])
+        filenames.append(fullFn)
+    
+    parseFunc = parseCaveFromFilename if cache is None else cache.parseCaveFromFilename
+    
+    if workers == 1 or len(filenames) <= 1:
+        caves = map(parseFunc, filenames)
+        return dict(zip(names, caves))
+    
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        caves = executor.map(parseFunc, filenames, chunksize=4)
+        return dict(zip(names, caves))
+
+
+## Returns the type of a block, given its position in the file.
+#  @param blockNr Index of the block in the file, starting at 0.
+#  @return The block type. Use BLOCK_*.
+def getBlockType(blockNr):
+    if blockNr == 0:
+        return BLOCK_CAVE_INFO
+    return SUBLEVEL_BLOCKS[(blockNr - 1) % len(SUBLEVEL_BLOCKS)]
+
+
+## Given a list of blocks to read, returns the set of blocks to skip.
+#  The CaveInfo block is never skipped, since it says how many sublevels there are.
+#  @param blocks List of blocks to read. Use BLOCK_*. None for all of them.
+#  @return The set of blocks to skip, or None if none are to be skipped.
+def getSkippedBlocks(blocks):
+    if blocks is None:
+        return None
+    return set(SUBLEVEL_BLOCKS) - set(blocks)
+
+
+## Reads the lines of a cave file, only once, and yields typed tokens out of them.
+#  Besides figuring out which blocks to skip, the tokenizer knows nothing about
+#  what each block means; that's up to readCaveTokens().
+#  @param infile Input file, or any iterable of lines.
+#  @param skipBlocks Optional set of blocks to skip. Use BLOCK_*. Only their
+#  opening and closing braces are emitted.
+#  @return A generator of (token type, value) tuples. Use TOKEN_*.
+def tokenizeCave(infile, skipBlocks=None):
+    expectingCount = False
+    blocksOpened = 0
+    skipping = False
     
     for line in infile:
-        line = cleanLine(line)
-        if len(line) == 0 : continue
+        if skipping:
+            # Only look for the closing brace.
+            if line.lstrip(' \t')[:1] != '}' : continue
+            skipping = False
+            yield TOKEN_BLOCK_CLOSE, None
+            continue
         
-        if searchingStart:
+        # Same as cleanLine(), but inlined, since this runs for every line of the file.
+        numberSignPos = line.find('#')
+        if numberSignPos != -1:
+            line = line[:numberSignPos]
+        line = line.strip(' \t\r\n')
+        if not line : continue
+        
+        if line[0] == '{':
             if line == '{':
-                searchingStart = False
+                expectingCount = True
+                yield TOKEN_BLOCK_OPEN, None
+                if skipBlocks and getBlockType(blocksOpened) in skipBlocks:
+                    skipping = True
+                blocksOpened += 1
+            elif line.startswith('{_eof}'):
+                yield TOKEN_EOF, None
+            else:
+                words = line.split()
+                expectingCount = False
+                yield TOKEN_KEY_VALUE, (words[0], words[2] if len(words) > 2 else '')
+        
+        elif line == '}':
+            expectingCount = False
+            yield TOKEN_BLOCK_CLOSE, None
+        
+        elif expectingCount:
+            expectingCount = False
+            yield TOKEN_COUNT, int(line)
         
         else:
-            if line.find('{c000}') != -1:
-                sublevelTotal = int(line[9:])
-                for s in range(sublevelTotal):
-                    caveData.sublevels.append(RawSublevel())
-                
-            elif line.find('{_eof}') != -1:
+            yield TOKEN_ENTRY, line
+
+
+## Finds the contents of each non-empty line of a cave file's bytes,
+#  without the indentation, comments, and trailing spaces.
+CAVE_LINE_REGEX = re.compile(rb'^[ \t]*([^#\r\n \t]+(?:[ \t]+[^#\r\n \t]+)*)', re.MULTILINE)
+
+
+## Finds the next line that is only an opening brace, in a cave file's bytes.
+BLOCK_OPEN_REGEX = re.compile(rb'^[ \t]*\{[ \t]*(?:#[^\n]*)?\r?$', re.MULTILINE)
+
+
+## Finds the next line that starts with a closing brace, in a cave file's bytes.
+BLOCK_CLOSE_REGEX = re.compile(rb'^[ \t]*\}', re.MULTILINE)
+
+
+## Same as tokenizeCave(), but it works directly on the bytes of a cave file,
+#  like a bytes object or a memory-mapped file. Comments are never decoded,
+#  and only the keys, values and entry lines are. Skipped blocks are jumped
+#  over in one search.
+#  @param data The cave file's bytes.
+#  @param skipBlocks Optional set of blocks to skip. Use BLOCK_*.
+#  @return A generator of (token type, value) tuples. Use TOKEN_*.
+def tokenizeCaveBytes(data, skipBlocks=None):
+    if not skipBlocks:
+        yield from tokenizeCaveByteLines(CAVE_LINE_REGEX.findall(data))
+        return
+    
+    blocksOpened = 0
+    pos = 0
+    while True:
+        # Tokenize up until the start of the next block to skip.
+        start = pos
+        while True:
+            match = BLOCK_OPEN_REGEX.search(data, pos)
+            if match is None:
+                yield from tokenizeCaveByteLines(CAVE_LINE_REGEX.findall(data, start))
                 return
+            pos = match.end()
+            blocksOpened += 1
+            if getBlockType(blocksOpened - 1) in skipBlocks : break
+        
+        yield from tokenizeCaveByteLines(CAVE_LINE_REGEX.findall(data, start, match.start()))
+        yield TOKEN_BLOCK_OPEN, None
+        
+        # Jump over to the end of the block.
+        match = BLOCK_CLOSE_REGEX.search(data, pos)
+        if match is None : return
+        yield TOKEN_BLOCK_CLOSE, None
+        pos = match.end()
 
 
-## Reads the FloorInfo block in a text file and fills the cave data object.
-#  @param infile Input file.
-#  @param caveData The RawCave cave data object to fill.
-#  @param sublevelNr This sublevel's index number.
-def readFloorinfo(infile, caveData, sublevelNr):
-    searchingStart = True
+## Turns the lines found by CAVE_LINE_REGEX into tokens. Used by tokenizeCaveBytes().
+#  @param lines List of the cleaned lines, as bytes.
+#  @return A generator of (token type, value) tuples. Use TOKEN_*.
+def tokenizeCaveByteLines(lines):
+    expectingCount = False
     
-    for line in infile:
-        line = cleanLine(line)
-        if len(line) == 0 : continue
+    for line in lines:
+        if line[0] == 0x7B: # '{'
+            if line == b'{':
+                expectingCount = True
+                yield TOKEN_BLOCK_OPEN, None
+            elif line.startswith(b'{_eof}'):
+                yield TOKEN_EOF, None
+            else:
+                words = line.decode('utf-8', errors='ignore').split()
+                expectingCount = False
+                yield TOKEN_KEY_VALUE, (words[0], words[2] if len(words) > 2 else '')
         
-        if searchingStart:
-            if line == '{':
-                searchingStart = False
+        elif line == b'}':
+            expectingCount = False
+            yield TOKEN_BLOCK_CLOSE, None
+        
+        elif expectingCount:
+            expectingCount = False
+            yield TOKEN_COUNT, int(line)
         
         else:
-            info = caveData.sublevels[sublevelNr].info
-            words = line.split()
-            
-            if words[0] == '{f000}':
-                info.sublevelNumberF000 = int(words[2])
-            elif words[0] == '{f001}':
-                info.sublevelNumberF001 = int(words[2])
-            elif words[0] == '{f002}':
-                info.mainObjectIdealMax = int(words[2])
-            elif words[0] == '{f003}':
-                info.treasureObjectIdealMax = int(words[2])
-            elif words[0] == '{f004}':
-                info.gateObjectIdealMax = int(words[2])
-            elif words[0] == '{f005}':
-                info.roomUnits = int(words[2])
-            elif words[0] == '{f006}':
-                info.corridorRoomRatio = float(words[2])
-            elif words[0] == '{f007}':
-                info.hasGeyser = int(words[2])
-            elif words[0] == '{f008}':
-                info.caveUnitListFilename = words[2]
-            elif words[0] == '{f009}':
-                info.lightingFilename = words[2]
-            elif words[0] == '{f00A}':
-                info.skybox = words[2]
-            elif words[0] == '{f010}':
-                info.hasClog = int(words[2])
-            elif words[0] == '{f011}':
-                info.unknownF011 = words[2]
-            elif words[0] == '{f012}':
-                info.musicType = int(words[2])
-            elif words[0] == '{f013}':
-                info.hasFloor = int(words[2])
-            elif words[0] == '{f014}':
-                info.deadEndChance = int(words[2])
-            elif words[0] == '{f015}':
-                info.fileFormat = int(words[2])
-            elif words[0] == '{f016}':
-                info.waterwraithTime = float(words[2])
-            elif words[0] == '{f017}':
-                info.hasSeesawBlocks = int(words[2])
-            elif words[0] == '{_eof}':
-                return
+            yield TOKEN_ENTRY, line.decode('utf-8', errors='ignore')
 
 
-## Reads the TekiInfo block in a text file and fills the cave data object.
-#  @param infile Input file.
-#  @param caveData The RawCave cave data object to fill.
-#  @param sublevelNr This sublevel's index number.
-def readTekiinfo(infile, caveData, sublevelNr):
-    searchingStart = True
-    searchingCount = True
-    nextIsWeight = True
-    entryCount = 0
-    entryNr = 0
-    weightStr = ''
+## State machine that takes the tokens from tokenizeCave() and builds the
+#  cave's sublevels out of them. The meaning of each block is decided by its
+#  position in the file, and the tokens are routed to the right reader via BLOCK_READERS.
+#  @param tokens Iterable of (token type, value) tuples, like the ones from tokenizeCave().
+#  @param caveData The RawCave cave data object whose cave-wide info gets filled.
+#  The sublevels are not added to it; that's up to the caller.
+#  @return A generator of RawSublevel objects, each yielded once its CapInfo block closes.
+def readCaveTokens(tokens, caveData):
+    # Number of blocks opened so far.
+    blocksOpened = 0
+    # Type of the current block. Use BLOCK_*. None if it's being ignored.
+    block = None
+    # Sublevel the current block belongs to, or None for the CaveInfo block.
+    sublevel = None
+    # Number of lines each entry of the current block takes up.
+    entryLineCount = 0
+    # Functions that read the current block's key-value lines and entries.
+    keyReader = None
+    entryReader = None
+    # How many entries are left to read in the current block.
+    entriesLeft = 0
+    # Lines of the entry currently being read.
+    entryLines = []
     
-    for line in infile:
-        line = cleanLine(line)
-        if len(line) == 0 : continue
+    for tokenType, value in tokens:
+        if tokenType == TOKEN_KEY_VALUE:
+            if keyReader is not None:
+                keyReader(caveData, sublevel, value[0], value[1])
         
-        if searchingStart:
-            if line == '{':
-                searchingStart = False
+        elif tokenType == TOKEN_ENTRY:
+            if entriesLeft == 0 : continue
+            entryLines.append(value)
+            if len(entryLines) == entryLineCount:
+                entryReader(sublevel, entryLines)
+                entryLines = []
+                entriesLeft -= 1
         
-        elif searchingCount:
-            entryCount = int(line)
-            if entryCount == 0 : return
-            for e in range(entryCount):
-                caveData.sublevels[sublevelNr].tekiObjects.append(RawObject())
-            searchingCount = False
+        elif tokenType == TOKEN_COUNT:
+            if entryReader is not None:
+                entriesLeft = value
         
-        else:
-            obj = caveData.sublevels[sublevelNr].tekiObjects[entryNr]
-            if nextIsWeight:
-                words = line.split()
-                
-                if words[0][0] == '$':
-                    if words[0][1].isdigit():
-                        obj.spawnMethod = words[0][0:2]
-                        words[0] = words[0][2:]
-                    else:
-                        obj.spawnMethod = '$'
-                        words[0] = words[0][1:]
-                
-                underscorePos = words[0].find('_')
-                if underscorePos == -1:
-                    obj.objClass = words[0]
-                else:
-                    internalNameFound = False
-                    tentativeInternalName = words[0][:underscorePos]
-                    while underscorePos != -1:
-                        if tentativeInternalName.lower() in constants.OBJECTS:
-                            internalNameFound = True
-                            break
-                        else:
-                            underscorePos = words[0].find('_', underscorePos + 1)
-                            tentativeInternalName = words[0][:underscorePos]
-                
-                    if internalNameFound and underscorePos != -1:
-                        obj.objClass = words[0][:underscorePos]
-                        obj.carrying = words[0][underscorePos + 1:]
-                    else:
-                        obj.objClass = words[0]
-                
-                weightStr = words[1]
-                
-                nextIsWeight = False
-                
-            else:
-                obj.spawnType = int(line)
-                
-                if obj.spawnType == 6:
-                    obj.minAmount = int(weightStr)
-                else:
-                    obj.minAmount, obj.weight = splitWeightStr(weightStr)
-                
-                nextIsWeight = True
-                entryNr += 1
+        elif tokenType == TOKEN_BLOCK_OPEN:
+            # Figure out which block this is from its position.
+            blockNr = blocksOpened
+            blocksOpened += 1
+            entriesLeft = 0
+            entryLines = []
+            block = getBlockType(blockNr)
             
-            if entryNr == entryCount:
-                return
+            if block != BLOCK_CAVE_INFO:
+                if (blockNr - 1) // len(SUBLEVEL_BLOCKS) >= caveData.sublevelTotal:
+                    # More blocks than sublevels. Ignore them.
+                    block = None
+                    keyReader = None
+                    entryReader = None
+                    continue
+                if block == BLOCK_FLOOR_INFO:
+                    if sublevel is not None:
+                        yield sublevel
+                    sublevel = RawSublevel()
             
+            entryLineCount, keyReader, entryReader = BLOCK_READERS[block]
+        
+        elif tokenType == TOKEN_BLOCK_CLOSE:
+            if block == BLOCK_CAP_INFO:
+                yield sublevel
+                sublevel = None
+            block = None
+            keyReader = None
+            entryReader = None
+            entriesLeft = 0
     
-## Reads the ItemInfo block in a text file and fills the cave data object.
+    # In case the file ended before the last sublevel's CapInfo block was closed.
+    if sublevel is not None:
+        yield sublevel
+
+
+## Reads a key-value line of the CaveInfo block and fills the cave data object.
+#  @param caveData The RawCave cave data object to fill.
+#  @param sublevel Unused.
+#  @param key The line's key, like '{c000}'.
+#  @param value The line's value, as a string.
+def readCaveinfoKey(caveData, sublevel, key, value):
+    if key == '{c000}':
+        caveData.sublevelTotal = int(value)
+
+
+## For each FloorInfo key, the RawSublevelInfo attribute it fills, and the function
+#  that converts the value string.
+FLOOR_INFO_KEYS = {
+    '{f000}' : ('sublevelNumberF000',     int  ),
+    '{f001}' : ('sublevelNumberF001',     int  ),
+    '{f002}' : ('mainObjectIdealMax',     int  ),
+    '{f003}' : ('treasureObjectIdealMax', int  ),
+    '{f004}' : ('gateObjectIdealMax',     int  ),
+    '{f005}' : ('roomUnits',              int  ),
+    '{f006}' : ('corridorRoomRatio',      float),
+    '{f007}' : ('hasGeyser',              int  ),
+    '{f008}' : ('caveUnitListFilename',   str  ),
+    '{f009}' : ('lightingFilename',       str  ),
+    '{f00A}' : ('skybox',                 str  ),
+    '{f010}' : ('hasClog',                int  ),
+    '{f011}' : ('unknownF011',            str  ),
+    '{f012}' : ('musicType',              int  ),
+    '{f013}' : ('hasFloor',               int  ),
+    '{f014}' : ('deadEndChance',          int  ),
+    '{f015}' : ('fileFormat',             int  ),
+    '{f016}' : ('waterwraithTime',        float),
+    '{f017}' : ('hasSeesawBlocks',        int  ),
+}
+
+
+## Reads a key-value line of the FloorInfo block and fills the sublevel's info.
+#  @param caveData Unused.
+#  @param sublevel The RawSublevel object to fill.
+#  @param key The line's key, like '{f002}'.
+#  @param value The line's value, as a string.
+def readFloorinfoKey(caveData, sublevel, key, value):
+    keyInfo = FLOOR_INFO_KEYS.get(key)
+    if keyInfo is None : return
+    setattr(sublevel.info, keyInfo[0], keyInfo[1](value))
+
+
+## Reads an entry of the TekiInfo block and adds it to the sublevel.
+#  @param sublevel The RawSublevel object to fill.
+#  @param lines The entry's two lines: class and weight, and then spawn type.
+def readTekiinfoEntry(sublevel, lines):
+    obj = RawObject()
+    words = lines[0].split()
+    
+    if words[0][0] == '$':
+        if words[0][1].isdigit():
+            obj.spawnMethod = words[0][0:2]
+            words[0] = words[0][2:]
+        else:
+            obj.spawnMethod = '$'
+            words[0] = words[0][1:]
+    
+    obj.objClass, obj.carrying = splitCarriedClass(words[0])
+    weightStr = words[1]
+    
+    obj.spawnType = int(lines[1])
+    
+    if obj.spawnType == 6:
+        obj.minAmount = int(weightStr)
+    else:
+        obj.minAmount, obj.weight = splitWeightStr(weightStr)
+    
+    sublevel.tekiObjects.append(obj)
+
+
+## Reads an entry of the ItemInfo block and adds it to the sublevel.
+#  @param sublevel The RawSublevel object to fill.
+#  @param lines The entry's only line: class and weight.
+def readIteminfoEntry(sublevel, lines):
+    obj = RawObject()
+    words = lines[0].split()
+    
+    obj.objClass = words[0]
+    obj.minAmount, obj.weight = splitWeightStr(words[1])
+    
+    sublevel.itemObjects.append(obj)
+
+
+## Reads an entry of the GateInfo block and adds it to the sublevel.
+#  @param sublevel The RawSublevel object to fill.
+#  @param lines The entry's two lines: keyword and health, and then weight.
+def readGateinfoEntry(sublevel, lines):
+    obj = RawGate()
+    words = lines[0].split()
+    
+    obj.keyword = words[0]
+    obj.health = float(words[1])
+    obj.minAmount, obj.weight = splitWeightStr(lines[1])
+    
+    sublevel.gateObjects.append(obj)
+
+
+## Reads an entry of the CapInfo block and adds it to the sublevel.
+#  @param sublevel The RawSublevel object to fill.
+#  @param lines The entry's three lines: cap type, then class and weight, and then spawn type.
+def readCapinfoEntry(sublevel, lines):
+    obj = RawObject()
+    obj.capType = int(lines[0])
+    words = lines[1].split()
+    
+    if words[0][0] == '$':
+        if words[0][1].isdigit():
+            obj.spawnMethod = words[0][0:1]
+            words[0] = words[0][2:]
+        else:
+            obj.spawnMethod = '$'
+            words[0] = words[0][1:]
+    
+    obj.objClass, obj.carrying = splitCarriedClass(words[0])
+    
+    obj.spawnType = int(lines[2])
+    obj.minAmount, obj.weight = splitWeightStr(words[1])
+    
+    sublevel.capObjects.append(obj)
+
+
+## Dispatch table for each type of block. Each value is a tuple with
+#  how many lines each entry takes, the function that reads key-value lines,
+#  and the function that reads entries.
+BLOCK_READERS = {
+    BLOCK_CAVE_INFO  : (0, readCaveinfoKey,  None             ),
+    BLOCK_FLOOR_INFO : (0, readFloorinfoKey, None             ),
+    BLOCK_TEKI_INFO  : (2, None,             readTekiinfoEntry),
+    BLOCK_ITEM_INFO  : (1, None,             readIteminfoEntry),
+    BLOCK_GATE_INFO  : (2, None,             readGateinfoEntry),
+    BLOCK_CAP_INFO   : (3, None,             readCapinfoEntry ),
+}
+
+
+## Reads the next block of the given type from a text file, starting at the
+#  file's current position, and fills the cave data with it. The file is left
+#  right after the block, so the next block can be read with another call.
+#  Used by readCaveinfo() and the other block readers.
 #  @param infile Input file.
 #  @param caveData The RawCave cave data object to fill.
-#  @param sublevelNr This sublevel's index number.
-def readIteminfo(infile, caveData, sublevelNr):
+#  @param sublevel The RawSublevel object to fill, or None for the CaveInfo block.
+#  @param block Type of the block. Use BLOCK_*.
+def readBlockFromFile(infile, caveData, sublevel, block):
+    entryLineCount, keyReader, entryReader = BLOCK_READERS[block]
     searchingStart = True
-    searchingCount = True
-    entryCount = 0
-    entryNr = 0
+    entriesLeft = 0
+    entryLines = []
     
-    for line in infile:
-        line = cleanLine(line)
-        if len(line) == 0 : continue
-        
+    for tokenType, value in tokenizeCave(infile):
         if searchingStart:
-            if line == '{':
+            if tokenType == TOKEN_BLOCK_OPEN:
                 searchingStart = False
+            continue
         
-        elif searchingCount:
-            entryCount = int(line)
-            if entryCount == 0 : return
-            for e in range(entryCount):
-                caveData.sublevels[sublevelNr].itemObjects.append(RawObject())
-            searchingCount = False
-        
-        else:
-            obj = caveData.sublevels[sublevelNr].itemObjects[entryNr]
-            words = line.split()
-            
-            obj.objClass = words[0]
-            obj.minAmount, obj.weight = splitWeightStr(words[1])
-            
-            entryNr += 1
-            
-            if entryNr == entryCount:
-                return
+        if tokenType == TOKEN_BLOCK_CLOSE or tokenType == TOKEN_EOF:
+            return
+        elif tokenType == TOKEN_KEY_VALUE:
+            if keyReader is not None:
+                keyReader(caveData, sublevel, value[0], value[1])
+        elif tokenType == TOKEN_COUNT:
+            if entryReader is not None:
+                entriesLeft = value
+        elif tokenType == TOKEN_ENTRY:
+            if entriesLeft == 0 : continue
+            entryLines.append(value)
+            if len(entryLines) == entryLineCount:
+                entryReader(sublevel, entryLines)
+                entryLines = []
+                entriesLeft -= 1
+
+
+## Reads the CaveInfo block in a text file and fills the cave data object,
+#  adding a blank RawSublevel for each of the cave's sublevels.
+#  parseCaveFromFile() reads the whole file in one go, so this is only
+#  needed to read a cave file one block at a time.
+#  @param infile Input file.
+#  @param caveData The RawCave cave data object to fill.
+def readCaveinfo(infile, caveData):
+    readBlockFromFile(infile, caveData, None, BLOCK_CAVE_INFO)
+    while len(caveData.sublevels) < caveData.sublevelTotal:
+        caveData.sublevels.append(RawSublevel())
+
+
+## Reads the FloorInfo block in a text file and fills the cave data object.
+#  @param infile Input file.
+#  @param caveData The RawCave cave data object to fill.
+#  @param sublevelNr This sublevel's index number.
+def readFloorinfo(infile, caveData, sublevelNr):
+    readBlockFromFile(infile, caveData, caveData.sublevels[sublevelNr], BLOCK_FLOOR_INFO)
+
+
+## Reads the TekiInfo block in a text file and fills the cave data object.
+#  @param infile Input file.
+#  @param caveData The RawCave cave data object to fill.
+#  @param sublevelNr This sublevel's index number.
+def readTekiinfo(infile, caveData, sublevelNr):
+    readBlockFromFile(infile, caveData, caveData.sublevels[sublevelNr], BLOCK_TEKI_INFO)
+
+
+## Reads the ItemInfo block in a text file and fills the cave data object.
+#  @param infile Input file.
+#  @param caveData The RawCave cave data object to fill.
+#  @param sublevelNr This sublevel's index number.
+def readIteminfo(infile, caveData, sublevelNr):
+    readBlockFromFile(infile, caveData, caveData.sublevels[sublevelNr], BLOCK_ITEM_INFO)
 
 
 ## Reads the GateInfo block in a text file and fills the cave data object.
@@ -345,45 +708,7 @@ def readIteminfo(infile, caveData, sublevelNr):
 #  @param caveData The RawCave cave data object to fill.
 #  @param sublevelNr This sublevel's index number.
 def readGateinfo(infile, caveData, sublevelNr):
-    searchingStart = True
-    searchingCount = True
-    nextIsHealth = True
-    entryCount = 0
-    entryNr = 0
-    
-    for line in infile:
-        line = cleanLine(line)
-        if len(line) == 0 : continue
-        
-        if searchingStart:
-            if line == '{':
-                searchingStart = False
-        
-        elif searchingCount:
-            entryCount = int(line)
-            if entryCount == 0 : return
-            for e in range(entryCount):
-                caveData.sublevels[sublevelNr].gateObjects.append(RawGate())
-            searchingCount = False
-        
-        else:
-            obj = caveData.sublevels[sublevelNr].gateObjects[entryNr]
-            if nextIsHealth:
-                words = line.split()
-                
-                obj.keyword = words[0]
-                obj.health = float(words[1])
-                
-                nextIsHealth = False
-                
-            else:
-                obj.minAmount, obj.weight = splitWeightStr(line)
-                
-                nextIsHealth = True
-                entryNr += 1
-            
-            if entryNr == entryCount:
-                return
+    readBlockFromFile(infile, caveData, caveData.sublevels[sublevelNr], BLOCK_GATE_INFO)
 
 
 ## Reads the CapInfo block in a text file and fills the cave data object.
@@ -391,83 +716,69 @@ def readGateinfo(infile, caveData, sublevelNr):
 #  @param caveData The RawCave cave data object to fill.
 #  @param sublevelNr This sublevel's index number.
 def readCapinfo(infile, caveData, sublevelNr):
-    searchingStart = True
-    searchingCount = True
-    nextIsCapType = True
-    nextIsWeight = False
-    entryCount = 0
-    entryNr = 0
-    weightStr = ''
+    readBlockFromFile(infile, caveData, caveData.sublevels[sublevelNr], BLOCK_CAP_INFO)
+
+
+## Splits entry class names like 'Chappy_Yoyo_red' into the class of the object
+#  and the class of the object it is carrying. Internal names can have underscores
+#  too, so the known object names are indexed in a trie of underscore-separated
+#  words, and the shortest known name that prefixes the class is the object.
+class CarriedClassResolver:
     
-    for line in infile:
-        line = cleanLine(line)
-        if len(line) == 0 : continue
+    ## Constructor.
+    #  @param self Object pointer.
+    #  @param objects Dictionary (or any iterable) of known internal names, in all lowercase.
+    def __init__(self, objects):
+        # Root of the trie. Each node is a dictionary of words to child nodes.
+        # A node whose path is a known name has the key None.
+        self.root = {}
+        # Results of previous splits, since the same names show up over and over.
+        self.cache = {}
         
-        if searchingStart:
-            if line == '{':
-                searchingStart = False
+        for name in objects:
+            node = self.root
+            for word in name.split('_'):
+                node = node.setdefault(word, {})
+            node[None] = True
+    
+    
+    ## Splits a class name into the object's class and the carried object's class.
+    #  @param self Object pointer.
+    #  @param fullClass The full class name, without the spawn method.
+    #  @return A tuple of the object class and the carried object class (or None).
+    def split(self, fullClass):
+        result = self.cache.get(fullClass)
+        if result is not None:
+            return result
         
-        elif searchingCount:
-            entryCount = int(line)
-            if entryCount == 0 : return
-            for e in range(entryCount):
-                caveData.sublevels[sublevelNr].capObjects.append(RawObject())
-            searchingCount = False
+        result = (fullClass, None)
+        words = fullClass.split('_')
+        node = self.root
+        pos = -1
+        # The object's class can't be the whole name, or there'd be nothing to carry.
+        for word in words[:-1]:
+            node = node.get(word.lower())
+            if node is None : break
+            pos += len(word) + 1
+            if None in node:
+                result = (fullClass[:pos], fullClass[pos + 1:])
+                break
         
-        else:
-            obj = caveData.sublevels[sublevelNr].capObjects[entryNr]
-            if nextIsCapType:
-                obj.capType = int(line)
-                
-                nextIsCapType = False
-                nextIsWeight = True
-                
-            elif nextIsWeight:
-                words = line.split()
-                
-                if words[0][0] == '$':
-                    if words[0][1].isdigit():
-                        obj.spawnMethod = words[0][0:1]
-                        words[0] = words[0][2:]
-                    else:
-                        obj.spawnMethod = '$'
-                        words[0] = words[0][1:]
-                
-                underscorePos = words[0].find('_')
-                if underscorePos == -1:
-                    obj.objClass = words[0]
-                else:
-                    internalNameFound = False
-                    tentativeInternalName = words[0][:underscorePos]
-                    while underscorePos != -1:
-                        if tentativeInternalName.lower() in constants.OBJECTS:
-                            internalNameFound = True
-                            break
-                        else:
-                            underscorePos = words[0].find('_', underscorePos + 1)
-                            tentativeInternalName = words[0][:underscorePos]
-                
-                    if internalNameFound and underscorePos != -1:
-                        obj.objClass = words[0][:underscorePos]
-                        obj.carrying = words[0][underscorePos + 1:]
-                    else:
-                        obj.objClass = words[0]
-                
-                weightStr = words[1]
-                
-                nextIsCapType = False
-                nextIsWeight = False
-                
-            else:
-                obj.spawnType = int(line)
-                obj.minAmount, obj.weight = splitWeightStr(weightStr)
-                
-                nextIsCapType = True
-                nextIsWeight = False
-                entryNr += 1
-            
-            if entryNr == entryCount:
-                return
+        self.cache[fullClass] = result
+        return result
+
+
+## Resolver for the objects in constants.OBJECTS, used by the TekiInfo and CapInfo readers.
+CARRIED_CLASS_RESOLVER = CarriedClassResolver(constants.OBJECTS)
+
+
+## Splits an entry's class name into the class of the object, and the class
+#  of the object it is carrying, if any. e.g. 'Chappy_Yoyo_red' is a Red Bulborb
+#  carrying the 'Yoyo_red' treasure.
+#  @param fullClass The full class name, without the spawn method.
+#  @return A tuple of the object class and the carried object class (or None).
+def splitCarriedClass(fullClass):
+    return CARRIED_CLASS_RESOLVER.split(fullClass)
 
 
 ## Cleans a line, removing its comments and indentation.
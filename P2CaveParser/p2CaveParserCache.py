@@ -0,0 +1,224 @@
+##
+#  The purpose of this code is to provide the RawCaveCache class, which keeps
+#  the RawCave objects of cave files that were already parsed on the disk,
+#  so that cave files that didn't change don't need to be parsed again.
+#  Each cave file's data is stored in its own file, named after the hash of
+#  the cave file's contents. The cache is trimmed down to a maximum size by
+#  deleting the least recently used files first.
+
+
+import hashlib
+import io
+import marshal
+import os
+import P2CaveParser.p2CaveParser as p2cp
+import P2CaveParser.constants as constants
+
+
+# Version of the format of the cache files. Bump this if the way they are written changes.
+CACHE_FORMAT_VERSION = 1
+# Extension of the cache files.
+CACHE_FILE_EXTENSION = '.p2cc'
+# Default maximum size of the cache directory, in bytes.
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# Attributes of a RawSublevelInfo object that get stored, in order.
+# Taken from the class itself, so that new attributes get stored too.
+RAW_SUBLEVEL_INFO_FIELDS = p2cp.RawSublevelInfo.__slots__
+# Attributes of a RawObject object that get stored, in order.
+RAW_OBJECT_FIELDS = p2cp.RawObject.__slots__
+# Attributes of a RawGate object that get stored, in order.
+RAW_GATE_FIELDS = p2cp.RawGate.__slots__
+
+
+## Persistent, size-bounded cache of parsed cave files.
+class RawCaveCache:
+    
+    ## Constructor.
+    #  @param self Object pointer.
+    #  @param directory Directory to keep the cache files in. It's created if needed.
+    #  @param maxSize Maximum total size of the cache files, in bytes.
+    def __init__(self, directory, maxSize=DEFAULT_MAX_SIZE):
+        # Directory the cache files are kept in.
+        self.directory = directory
+        # Maximum total size of the cache files, in bytes.
+        self.maxSize = maxSize
+        # Stamp that identifies the parser code that made the cached data.
+        self.versionStamp = getParserVersionStamp()
+        # Total size of the cache files, in bytes, as of the last time they were
+        # all checked, plus whatever was saved since then. None if not known yet.
+        # Files saved by other processes only get counted the next time they are
+        # all checked, so the cache can go a bit over its maximum size until then.
+        self.totalSize = None
+        
+        os.makedirs(directory, exist_ok=True)
+    
+    
+    ## Returns the RawCave object of a cave file, either from the cache, or
+    #  by parsing it (and then caching it).
+    #  @param self Object pointer.
+    #  @param filename Name of the cave file.
+    #  @return The parsed cave data.
+    def parseCaveFromFilename(self, filename):
+        with open(filename, 'rb') as infile:
+            contents = infile.read()
+        return self.parseCaveFromBytes(contents)
+    
+    
+    ## Returns the RawCave object of a cave file's contents, either from the
+    #  cache, or by parsing them (and then caching them).
+    #  @param self Object pointer.
+    #  @param contents The cave file's bytes.
+    #  @param contentsHash SHA-1 hex digest of the contents, if it's already known.
+    #  @return The parsed cave data.
+    def parseCaveFromBytes(self, contents, contentsHash=None):
+        if contentsHash is None:
+            contentsHash = hashlib.sha1(contents).hexdigest()
+        cachePath = os.path.join(self.directory, contentsHash + CACHE_FILE_EXTENSION)
+        
+        caveData = self.load(cachePath)
+        if caveData is not None:
+            return caveData
+        
+        caveData = p2cp.parseCaveFromFile(io.StringIO(contents.decode('utf-8', errors='ignore')))
+        self.save(cachePath, caveData)
+        return caveData
+    
+    
+    ## Loads a cave's data from a cache file, if it exists and was made by
+    #  the current parser code.
+    #  @param self Object pointer.
+    #  @param cachePath Path to the cache file.
+    #  @return The RawCave object, or None if it's not cached.
+    def load(self, cachePath):
+        try:
+            with open(cachePath, 'rb') as cacheFile:
+                stamp, data = marshal.load(cacheFile)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        
+        if stamp != self.versionStamp:
+            return None
+        
+        # Mark it as recently used.
+        try:
+            os.utime(cachePath)
+        except OSError:
+            pass
+        
+        return caveFromTuple(data)
+    
+    
+    ## Saves a cave's data into a cache file, and then trims the cache if it
+    #  went over its maximum size. The cache files are only all checked the first
+    #  time, and whenever it needs trimming; otherwise, the new file's size is
+    #  just added to the running total.
+    #  @param self Object pointer.
+    #  @param cachePath Path to the cache file.
+    #  @param caveData The RawCave object to save.
+    def save(self, cachePath, caveData):
+        # Write to a temporary file first, so other processes never read a half-written one.
+        tempPath = '{0}.{1}.tmp'.format(cachePath, os.getpid())
+        try:
+            with open(tempPath, 'wb') as cacheFile:
+                marshal.dump((self.versionStamp, caveToTuple(caveData)), cacheFile)
+                newSize = cacheFile.tell()
+            try:
+                oldSize = os.path.getsize(cachePath)
+            except OSError:
+                oldSize = 0
+            os.replace(tempPath, cachePath)
+        except OSError:
+            return
+        
+        if self.totalSize is None:
+            self.trim()
+            return
+        
+        self.totalSize += newSize - oldSize
+        if self.totalSize > self.maxSize:
+            self.trim()
+    
+    
+    ## Deletes the least recently used cache files until the cache fits
+    #  within its maximum size, and updates the running total size.
+    #  @param self Object pointer.
+    def trim(self):
+        files = []
+        totalSize = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(CACHE_FILE_EXTENSION) : continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+            totalSize += stat.st_size
+        
+        if totalSize > self.maxSize:
+            files.sort()
+            for _, size, path in files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                totalSize -= size
+                if totalSize <= self.maxSize : break
+        
+        self.totalSize = totalSize
+
+
+## Returns a stamp that identifies the current parser code. Cached data made
+#  by a different version of the parser (or its object list), or by a different
+#  version of this module's code, is not reused.
+#  @return The stamp, as a string.
+def getParserVersionStamp():
+    h = hashlib.sha1('{0} {1}'.format(CACHE_FORMAT_VERSION, marshal.version).encode('ascii'))
+    for fn in (p2cp.__file__, constants.__file__, __file__):
+        with open(fn, 'rb') as sourceFile:
+            h.update(sourceFile.read())
+    return h.hexdigest()
+
+
+## Converts a RawCave object into nested tuples of plain values.
+#  @param caveData The RawCave object.
+#  @return The tuples.
+def caveToTuple(caveData):
+    sublevels = []
+    for s in caveData.sublevels:
+        sublevels.append((
+            tuple(getattr(s.info, f) for f in RAW_SUBLEVEL_INFO_FIELDS),
+            tuple(tuple(getattr(o, f) for f in RAW_OBJECT_FIELDS) for o in s.tekiObjects),
+            tuple(tuple(getattr(o, f) for f in RAW_OBJECT_FIELDS) for o in s.itemObjects),
+            tuple(tuple(getattr(o, f) for f in RAW_GATE_FIELDS) for o in s.gateObjects),
+            tuple(tuple(getattr(o, f) for f in RAW_OBJECT_FIELDS) for o in s.capObjects),
+        ))
+    return tuple(sublevels)
+
+
+## Converts the nested tuples made by caveToTuple() back into a RawCave object.
+#  @param data The tuples.
+#  @return The RawCave object.
+def caveFromTuple(data):
+    caveData = p2cp.RawCave()
+    for infoData, tekiData, itemData, gateData, capData in data:
+        s = p2cp.RawSublevel()
+        fillFromTuple(s.info, RAW_SUBLEVEL_INFO_FIELDS, infoData)
+        s.tekiObjects = [fillFromTuple(p2cp.RawObject(), RAW_OBJECT_FIELDS, o) for o in tekiData]
+        s.itemObjects = [fillFromTuple(p2cp.RawObject(), RAW_OBJECT_FIELDS, o) for o in itemData]
+        s.gateObjects = [fillFromTuple(p2cp.RawGate(), RAW_GATE_FIELDS, o) for o in gateData]
+        s.capObjects = [fillFromTuple(p2cp.RawObject(), RAW_OBJECT_FIELDS, o) for o in capData]
+        caveData.sublevels.append(s)
+    caveData.sublevelTotal = len(caveData.sublevels)
+    return caveData
+
+
+## Sets an object's attributes from a tuple of values.
+#  @param obj Object to fill.
+#  @param fields Names of the attributes, in the same order as the values.
+#  @param values The values.
+#  @return The object.
+def fillFromTuple(obj, fields, values):
+    for f, v in zip(fields, values):
+        setattr(obj, f, v)
+    return obj
@@ -7,6 +7,7 @@
 #  Special thanks to JHawk for their research in the sublevel generation algorithm.
 
 
+import os
 import P2CaveParser.constants as constants
 
 
@@ -43,6 +44,19 @@ class P2Cave:
             self.sublevels.append(P2Sublevel())
             self.sublevels[s].fromRaw(raw.sublevels[s])
             self.sublevels[s].number = s + 1
+    
+    ## Sets the cave's internal name and type, based on the name of its file.
+    #  @param self Self.
+    #  @param filename Name (or path) of the cave's text file.
+    def setNameFromFilename(self, filename):
+        _, caveFn = os.path.split(filename)
+        self.internalName = caveFn[:-4]
+        if self.internalName[:3] == 'ch_':
+            self.caveType = CAVE_TYPE_CHALLENGE
+        elif self.internalName[:3] == 'vs_':
+            self.caveType = CAVE_TYPE_BATTLE
+        else:
+            self.caveType = CAVE_TYPE_STORY
 
 
 ## Clean data about a cave's sublevel.
@@ -55,6 +69,14 @@ class P2Sublevel:
         self.info = P2SublevelInfo()
         # Full list of all entries that can or will spawn objects.
         self.allEntries = []
+        # Precomputed P2ClassAggregate of each object class, built from allEntries.
+        self.classAggregates = {}
+        # For each category, the list of entries used for filler.
+        self.fillerEntries = {}
+        # For each category, the set of object classes used for filler.
+        self.fillerClasses = {}
+        # How many entries allEntries had when the tables above were built.
+        self.aggregatedEntryCount = 0
 
 
     ## Builds information using a RawSublevel object.
@@ -128,6 +150,52 @@ class P2Sublevel:
             elif e.category == CAT_DEAD_END:
                 self.info.deadEndObjectMinTotal += e.minAmount
                 self.info.deadEndObjectWeightsSum += e.weight
+        
+        self.buildClassAggregates()
+    
+
+    ## Builds the per-class aggregate table and the filler tables out of
+    #  allEntries, so the class queries don't need to go through every entry.
+    #  This is done automatically if more entries get added to allEntries,
+    #  but if existing entries are changed, it must be called again.
+    #  @param self Self.
+    def buildClassAggregates(self):
+        self.classAggregates = {}
+        self.fillerEntries = {}
+        self.fillerClasses = {}
+
+        for e in self.allEntries:
+            if e.weight != 0:
+                self.fillerEntries.setdefault(e.category, []).append(e)
+                self.fillerClasses.setdefault(e.category, set()).add(e.objClass)
+
+            agg = self.classAggregates.get(e.objClass)
+            if agg is None:
+                agg = P2ClassAggregate()
+                self.classAggregates[e.objClass] = agg
+            agg.carriers.add(e.carriedBy)
+
+            if e.minAmount is None: continue
+            agg.minAmount += e.minAmount
+            if e.category == CAT_MAIN or e.category == CAT_TREASURE or e.category == CAT_GATE:
+                agg.categoryMinAmounts[e.category] = agg.categoryMinAmounts.get(e.category, 0) + e.minAmount
+                if e.weight > 0:
+                    agg.categoriesWithWeight.add(e.category)
+            elif e.category == CAT_DEAD_END and e.weight > 0:
+                agg.hasDeadEndWeight = True
+
+        self.aggregatedEntryCount = len(self.allEntries)
+    
+
+    ## Returns the precomputed aggregate of an object class, rebuilding the
+    #  tables first if entries were added since they were built.
+    #  @param self Self.
+    #  @param objClass Class name of the object in question.
+    #  @return The P2ClassAggregate, or None if no entry has that class.
+    def getClassAggregate(self, objClass):
+        if len(self.allEntries) != self.aggregatedEntryCount:
+            self.buildClassAggregates()
+        return self.classAggregates.get(objClass)
     
 
     ## For a given object class, calculates the minimum amount of instances
@@ -139,12 +207,10 @@ class P2Sublevel:
     #  @param objClass Class name of the object in question.
     #  @return The minimum amount.
     def getClassMinimumSpawns(self, objClass):
-        minAmount = 0
-
-        for e in self.allEntries:
-            if e.objClass != objClass: continue
-            if e.minAmount is None: continue
-            minAmount += e.minAmount
+        agg = self.getClassAggregate(objClass)
+        if agg is None:
+            return 0
+        minAmount = agg.minAmount
 
         if self.isOnlyFiller(CAT_MAIN, objClass):
             minAmount += self.info.mainObjectIdealMax - self.info.mainObjectMinTotal
@@ -166,51 +232,27 @@ class P2Sublevel:
     #  @param objClass Class name of the object in question.
     #  @return The maximum amount. None if it cannot be defined.
     def getClassMaximumSpawns(self, objClass):
-        minAmountInMain = 0
-        hasWeightInMain = False
-        minAmountInTreasure = 0
-        hasWeightInTreasure = False
-        minAmountInGate = 0
-        hasWeightInGate = False
-        minAmountElsewhere = 0
-        totalMinAmount = 0
+        agg = self.getClassAggregate(objClass)
+        if agg is None:
+            return 0
 
-        for e in self.allEntries:
-            if e.objClass != objClass: continue
-            if e.minAmount is None: continue
-
-            if e.category == CAT_MAIN:
-                if e.weight > 0:
-                    hasWeightInMain = True
-                minAmountInMain += e.minAmount
-            elif e.category == CAT_TREASURE:
-                if e.weight > 0:
-                    hasWeightInTreasure = True
-                minAmountInTreasure += e.minAmount
-            elif e.category == CAT_GATE:
-                if e.weight > 0:
-                    hasWeightInGate = True
-                minAmountInGate += e.minAmount
-            elif e.category == CAT_DEAD_END and e.weight > 0:
-                # If it has weight in dead ends, then the number cannot
-                # be determined, since the dead end amount cannot be determined.
-                return None
-            else:
-                minAmountElsewhere += e.minAmount
-            totalMinAmount += e.minAmount
+        if agg.hasDeadEndWeight:
+            # If it has weight in dead ends, then the number cannot
+            # be determined, since the dead end amount cannot be determined.
+            return None
 
         maxAmount = 0
-        if hasWeightInMain:
-            othersMinAmountInMain = self.info.mainObjectMinTotal - minAmountInMain
+        if CAT_MAIN in agg.categoriesWithWeight:
+            othersMinAmountInMain = self.info.mainObjectMinTotal - agg.categoryMinAmounts.get(CAT_MAIN, 0)
             maxAmount += self.info.mainObjectIdealMax - othersMinAmountInMain
-        if hasWeightInTreasure:
-            othersMinAmountInTreasure = self.info.treasureObjectMinTotal - minAmountInTreasure
+        if CAT_TREASURE in agg.categoriesWithWeight:
+            othersMinAmountInTreasure = self.info.treasureObjectMinTotal - agg.categoryMinAmounts.get(CAT_TREASURE, 0)
             maxAmount += self.info.treasureObjectIdealMax - othersMinAmountInTreasure
-        if hasWeightInGate:
-            othersMinAmountInGate = self.info.gateObjectMinTotal - minAmountInGate
+        if CAT_GATE in agg.categoriesWithWeight:
+            othersMinAmountInGate = self.info.gateObjectMinTotal - agg.categoryMinAmounts.get(CAT_GATE, 0)
             maxAmount += self.info.gateObjectIdealMax - othersMinAmountInGate
         
-        return max(totalMinAmount, maxAmount)
+        return max(agg.minAmount, maxAmount)
     
 
     ## Returns what entries will be used for filler, in a given category.
@@ -218,12 +260,9 @@ class P2Sublevel:
     #  @param category Category to check.
     #  @return A list of entries that will be used for filler.
     def getFillerEntries(self, category):
-        result = []
-        for e in self.allEntries:
-            if e.category != category: continue
-            if e.weight == 0: continue
-            result.append(e)
-        return result
+        if len(self.allEntries) != self.aggregatedEntryCount:
+            self.buildClassAggregates()
+        return list(self.fillerEntries.get(category, ()))
     
 
     ## Returns whether or not the given object class is the only object
@@ -234,12 +273,11 @@ class P2Sublevel:
     #  @return Whether it's the only filler or not. Also returns false if
     #  there are no fillers.
     def isOnlyFiller(self, category, objClass):
-        catFillers = self.getFillerEntries(category)
-        if len(catFillers) == 0: return False
-        for f in catFillers:
-            if f.objClass != objClass:
-                return False
-        return True
+        if len(self.allEntries) != self.aggregatedEntryCount:
+            self.buildClassAggregates()
+        catFillerClasses = self.fillerClasses.get(category)
+        if catFillerClasses is None: return False
+        return len(catFillerClasses) == 1 and objClass in catFillerClasses
     
 
     ## Returns whether or not a given treasure's object class has mixed
@@ -251,17 +289,31 @@ class P2Sublevel:
     #  @param objClass Class of the treasure in question.
     #  @return Whether it's got mixed carrying info.
     def doesTreasureHaveMixedCarrying(self, objClass):
-        gotFirst = False
-        firstInfo = None
-        for e in self.allEntries:
-            if e.objClass != objClass:
-                continue
-            if not gotFirst:
-                firstInfo = e.carriedBy
-                gotFirst = True
-            elif e.carriedBy != firstInfo:
-                return True
-        return False
+        agg = self.getClassAggregate(objClass)
+        if agg is None: return False
+        return len(agg.carriers) > 1
+
+
+## Precomputed totals about all of the entries of one object class in a sublevel.
+class P2ClassAggregate:
+
+    # Slotted, since each sublevel has one per class.
+    __slots__ = ('minAmount', 'categoryMinAmounts', 'categoriesWithWeight', 'hasDeadEndWeight', 'carriers')
+
+    ## Constructor.
+    #  @param self Self.
+    def __init__(self):
+        # Sum of the minimum amounts of all entries of this class.
+        self.minAmount = 0
+        # For the main, treasure, and gate categories, the sum of the minimum
+        # amounts of this class's entries in that category.
+        self.categoryMinAmounts = {}
+        # Set of the main, treasure, and gate categories where this class has an entry with weight.
+        self.categoriesWithWeight = set()
+        # Whether this class has an entry with weight in the dead end category.
+        self.hasDeadEndWeight = False
+        # Set of the IDs of the entries carrying this class's entries. None for entries that aren't carried.
+        self.carriers = set()
 
 
 ## Clean data about a sublevel's info.
@@ -348,6 +400,16 @@ class P2SublevelInfo:
 ## Clean data about an object entry in a sublevel.
 class P2SublevelEntry:
 
+    # A corpus can have tens of thousands of entries, so they use slots
+    # instead of a dict per object. The wiki* attributes are for tools that
+    # annotate entries with their own display information.
+    __slots__ = (
+        'id', 'objClass', 'category', 'carryingClass', 'carrying',
+        'carriedBy', 'spawnMethod', 'minAmount', 'weight', 'spawnType',
+        'gateHealth', 'gateKeyword', 'capType',
+        'wikiName', 'wikiType', 'wikiDisambig',
+    )
+
     ## Constructor.
     #  @param self Self.
     def __init__(self):
@@ -377,6 +439,12 @@ class P2SublevelEntry:
         self.gateKeyword = None
         # Type of dead end unit to use, for entries in CapInfo.
         self.capType = None
+        # Name to show on the wiki, if a tool fills it in.
+        self.wikiName = None
+        # Human-friendly type, like the ones in constants.OBJECTS, if a tool fills it in.
+        self.wikiType = None
+        # Disambiguation text to show on the wiki, if a tool fills it in.
+        self.wikiDisambig = None
     
 
     ## Builds information using a RawObject object.
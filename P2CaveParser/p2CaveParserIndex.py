@@ -0,0 +1,215 @@
+##
+#  The purpose of this code is to provide the P2CaveIndex class, an inverted
+#  index over the entries of many P2Cave objects. It answers questions like
+#  "which sublevels can have a Raging Long Legs?" without parsing or going
+#  through every cave again. The index can be saved to and loaded from the
+#  disk, and caves can be added, replaced or removed one at a time.
+
+
+import hashlib
+import marshal
+import os
+import P2CaveParser.p2CaveParser as p2cp
+import P2CaveParser.p2CaveParserCleaner as p2cpc
+import P2CaveParser.p2CaveParserCache as p2cpcache
+
+
+# Version of the format of the index files. Bump this if the way they are written changes.
+INDEX_FORMAT_VERSION = 1
+
+# Fields that entries are indexed by.
+# Object class, in all lowercase.
+FIELD_CLASS = 0
+# Class of the object the entry is carrying, in all lowercase.
+FIELD_CARRYING = 1
+# Spawn type number.
+FIELD_SPAWN_TYPE = 2
+# Category. Use p2cpc.CAT_*.
+FIELD_CATEGORY = 3
+
+
+## Inverted index over the entries of a corpus of caves.
+#  Each posting is a tuple of the cave's internal name, the sublevel number
+#  (starting at 1), and the entry's ID.
+class P2CaveIndex:
+
+    ## Constructor.
+    #  @param self Object pointer.
+    def __init__(self):
+        # Dictionary where each key is a (field, value) tuple, and each value is a set of postings.
+        self.postings = {}
+        # For each cave's internal name, a list of the (field, value, sublevel, entry ID)
+        # tuples it added, so the cave can be taken out again.
+        self.caveEntries = {}
+        # For each cave's internal name, a stamp of the data it was indexed from,
+        # like the hash of its file. None if unknown.
+        self.caveStamps = {}
+
+
+    ## Adds a cave to the index. If a cave with the same internal name
+    #  was already indexed, it gets replaced.
+    #  @param self Object pointer.
+    #  @param cave The P2Cave object. Its internalName must be set.
+    #  @param stamp Optional stamp of the data the cave came from. See updateFromDirectory().
+    def addCave(self, cave, stamp=None):
+        self.removeCave(cave.internalName)
+
+        entries = []
+        for s in cave.sublevels:
+            for e in s.allEntries:
+                if e.objClass is not None:
+                    entries.append((FIELD_CLASS, e.objClass, s.number, e.id))
+                if e.carryingClass is not None:
+                    entries.append((FIELD_CARRYING, e.carryingClass.lower(), s.number, e.id))
+                if e.spawnType is not None:
+                    entries.append((FIELD_SPAWN_TYPE, e.spawnType, s.number, e.id))
+                if e.category is not None:
+                    entries.append((FIELD_CATEGORY, e.category, s.number, e.id))
+
+        self.addEntries(cave.internalName, entries)
+        self.caveStamps[cave.internalName] = stamp
+
+
+    ## Adds a cave's (field, value, sublevel, entry ID) tuples to the postings.
+    #  @param self Object pointer.
+    #  @param caveName Internal name of the cave.
+    #  @param entries List of the tuples.
+    def addEntries(self, caveName, entries):
+        self.caveEntries[caveName] = entries
+        for field, value, sublevelNr, entryId in entries:
+            key = (field, value)
+            postingSet = self.postings.get(key)
+            if postingSet is None:
+                postingSet = set()
+                self.postings[key] = postingSet
+            postingSet.add((caveName, sublevelNr, entryId))
+
+
+    ## Removes a cave from the index. Nothing happens if it's not indexed.
+    #  @param self Object pointer.
+    #  @param caveName Internal name of the cave.
+    def removeCave(self, caveName):
+        entries = self.caveEntries.pop(caveName, None)
+        self.caveStamps.pop(caveName, None)
+        if entries is None : return
+
+        for field, value, sublevelNr, entryId in entries:
+            key = (field, value)
+            postingSet = self.postings[key]
+            postingSet.discard((caveName, sublevelNr, entryId))
+            if len(postingSet) == 0:
+                del self.postings[key]
+
+
+    ## Returns all entries that have a given value in a given field.
+    #  @param self Object pointer.
+    #  @param field Field to check. Use FIELD_*.
+    #  @param value Value to look for. Class names should be in all lowercase.
+    #  @return A sorted list of (cave internal name, sublevel number, entry ID) tuples.
+    def find(self, field, value):
+        return sorted(self.postings.get((field, value), ()))
+
+
+    ## Returns all sublevels that have an entry with a given value in a given field.
+    #  @param self Object pointer.
+    #  @param field Field to check. Use FIELD_*.
+    #  @param value Value to look for. Class names should be in all lowercase.
+    #  @return A sorted list of (cave internal name, sublevel number) tuples.
+    def findSublevels(self, field, value):
+        return sorted(set((p[0], p[1]) for p in self.postings.get((field, value), ())))
+
+
+    ## Brings the index up to date with the cave files in a directory.
+    #  Caves whose files changed (or are new) are parsed and indexed again,
+    #  and caves whose files are gone are removed. Each cave's stamp combines
+    #  the hash of its file with getIndexVersionStamp(), so if the code that
+    #  the entries come from changes, every cave is indexed again.
+    #  @param self Object pointer.
+    #  @param path Path to the directory.
+    #  @param cache Optional RawCaveCache (from p2CaveParserCache) to parse the files with.
+    #  @return The number of caves that were indexed again.
+    def updateFromDirectory(self, path, cache=None):
+        versionStamp = getIndexVersionStamp()
+        foundNames = set()
+        nUpdated = 0
+
+        for fn in sorted(os.listdir(path)):
+            fullFn = os.path.join(path, fn)
+            if not fn.lower().endswith('.txt') or not os.path.isfile(fullFn) : continue
+
+            caveName = fn[:-4]
+            foundNames.add(caveName)
+            with open(fullFn, 'rb') as caveFile:
+                contents = caveFile.read()
+            contentsHash = hashlib.sha1(contents).hexdigest()
+            stamp = hashlib.sha1((versionStamp + contentsHash).encode('ascii')).hexdigest()
+            if caveName in self.caveEntries and self.caveStamps.get(caveName) == stamp:
+                continue
+
+            if cache is None:
+                caveData = p2cp.parseCaveFromTokens(p2cp.tokenizeCaveBytes(contents))
+            else:
+                caveData = cache.parseCaveFromBytes(contents, contentsHash)
+            cave = p2cpc.P2Cave()
+            cave.fromRaw(caveData)
+            cave.setNameFromFilename(fullFn)
+            self.addCave(cave, stamp)
+            nUpdated += 1
+
+        for caveName in list(self.caveEntries):
+            if caveName not in foundNames:
+                self.removeCave(caveName)
+
+        return nUpdated
+
+
+    ## Saves the index to a file.
+    #  @param self Object pointer.
+    #  @param filename Name of the file to write.
+    def save(self, filename):
+        data = (
+            INDEX_FORMAT_VERSION,
+            [
+                (caveName, self.caveStamps.get(caveName), entries)
+                for caveName, entries in self.caveEntries.items()
+            ],
+        )
+        tempFilename = filename + '.tmp'
+        with open(tempFilename, 'wb') as indexFile:
+            marshal.dump(data, indexFile)
+        os.replace(tempFilename, filename)
+
+
+    ## Loads the index from a file written by save(), replacing whatever
+    #  was indexed before.
+    #  @param self Object pointer.
+    #  @param filename Name of the file to read.
+    def load(self, filename):
+        with open(filename, 'rb') as indexFile:
+            version, caves = marshal.load(indexFile)
+        if version != INDEX_FORMAT_VERSION:
+            raise RuntimeError(
+                'The index file "{0}" is in format version {1}, but version {2} was expected.'.format(
+                    filename, version, INDEX_FORMAT_VERSION
+                )
+            )
+
+        self.postings = {}
+        self.caveEntries = {}
+        self.caveStamps = {}
+        for caveName, stamp, entries in caves:
+            self.addEntries(caveName, entries)
+            self.caveStamps[caveName] = stamp
+
+
+## Returns a stamp that identifies the code that index entries come from:
+#  the parser and its object list (see p2cpcache.getParserVersionStamp()),
+#  the cleaner, which splits off the carried classes and sorts entries into
+#  categories, and this module.
+#  @return The stamp, as a string.
+def getIndexVersionStamp():
+    h = hashlib.sha1('{0} {1}'.format(INDEX_FORMAT_VERSION, p2cpcache.getParserVersionStamp()).encode('ascii'))
+    for fn in (p2cpc.__file__, __file__):
+        with open(fn, 'rb') as sourceFile:
+            h.update(sourceFile.read())
+    return h.hexdigest()
@@ -0,0 +1,214 @@
+##
+#  The purpose of this code is to provide simulateSublevelSpawns(), which
+#  takes a P2Sublevel and simulates the random filler of its main, treasure,
+#  gate, and dead end categories many times over, so that the distribution of
+#  each object class's amount can be known, instead of just its bounds.
+#  getSublevelSpawnDistributions() is its exact counterpart, which calculates
+#  the same distributions with polynomial convolution instead of sampling.
+#  Like P2Sublevel's getClassMinimumSpawns(), this assumes an ideal sublevel,
+#  where everything the game wants to spawn fits.
+#  This requires NumPy.
+
+
+import numpy as np
+import P2CaveParser.p2CaveParserCleaner as p2cpc
+
+
+# Class name used for gate entries, since those don't have an object class.
+GATE_CLASS = 'gate'
+
+
+## Simulates the spawning of a sublevel's objects many times, and returns
+#  how often each object class spawned each possible amount of times.
+#  The filler of each category is drawn as a multinomial over the category's
+#  filler entries, weighted by their weights, in batches of samples at a time.
+#  Objects carried by a filler entry spawn alongside it.
+#  @param sublevel The P2Sublevel object.
+#  @param samples Total number of sublevels to simulate. Must be at least 1.
+#  @param deadEnds Number of dead ends the sublevel is assumed to have. The ones left
+#  over after the dead end category's minimum amounts get filler objects.
+#  @param batchSize Number of sublevels to simulate at a time. Must be at least 1.
+#  @param seed Optional seed for the random number generator.
+#  @return A dictionary where each key is an object class (GATE_CLASS for gates),
+#  and each value is a NumPy array where index N is how many of the samples had
+#  exactly N objects of that class.
+def simulateSublevelSpawns(sublevel, samples=1000000, deadEnds=0, batchSize=100000, seed=None):
+    if samples < 1:
+        raise ValueError('The number of samples must be at least 1, but it is {0}.'.format(samples))
+    if batchSize < 1:
+        raise ValueError('The batch size must be at least 1, but it is {0}.'.format(batchSize))
+
+    rng = np.random.default_rng(seed)
+    classes, baseCounts, fillerCategories = getFillerModel(sublevel, deadEnds)
+
+    histograms = [np.zeros(1, dtype=np.int64) for c in classes]
+    samplesLeft = samples
+    while samplesLeft > 0:
+        batch = min(batchSize, samplesLeft)
+        samplesLeft -= batch
+
+        counts = np.tile(baseCounts, (batch, 1))
+        for nSpawns, chances, classMatrix in fillerCategories:
+            draws = rng.multinomial(nSpawns, chances, size=batch)
+            counts += draws @ classMatrix
+
+        for c in range(len(classes)):
+            histograms[c] = addHistograms(histograms[c], np.bincount(counts[:, c]))
+
+    return dict(zip(classes, histograms))
+
+
+## Calculates the exact probability of each object class spawning each
+#  possible amount of times, using the same model as simulateSublevelSpawns().
+#  Each filler spawn of a category adds some amount of a given class (usually
+#  0 or 1) with some chance, so the amount added by all of the category's
+#  filler spawns is that chance polynomial raised to the number of spawns.
+#  The categories are independent, so their polynomials get convolved together.
+#  @param sublevel The P2Sublevel object.
+#  @param deadEnds Number of dead ends the sublevel is assumed to have.
+#  Same as in simulateSublevelSpawns().
+#  @return A dictionary where each key is an object class (GATE_CLASS for gates),
+#  and each value is a NumPy array where index N is the probability that
+#  exactly N objects of that class spawn.
+def getSublevelSpawnDistributions(sublevel, deadEnds=0):
+    classes, baseCounts, fillerCategories = getFillerModel(sublevel, deadEnds)
+
+    distributions = {}
+    for c in range(len(classes)):
+        pmf = np.zeros(baseCounts[c] + 1)
+        pmf[baseCounts[c]] = 1.0
+        for nSpawns, chances, classMatrix in fillerCategories:
+            amounts = classMatrix[:, c]
+            if not amounts.any() : continue
+            # Chance of a single filler spawn adding 0, 1, etc. of this class.
+            spawnPoly = np.bincount(amounts, weights=chances)
+            pmf = np.convolve(pmf, getPolynomialPower(spawnPoly, nSpawns))
+        distributions[classes[c]] = pmf
+
+    return distributions
+
+
+## Returns the average amount in a distribution from getSublevelSpawnDistributions().
+#  @param pmf The distribution.
+#  @return The average amount.
+def getDistributionMean(pmf):
+    return float(np.dot(np.arange(len(pmf)), pmf))
+
+
+## Raises a polynomial, given as an array of coefficients, to a power,
+#  by repeated squaring.
+#  @param poly The polynomial's coefficients, from the lowest degree up.
+#  @param exponent The power to raise it to.
+#  @return The resulting polynomial's coefficients.
+def getPolynomialPower(poly, exponent):
+    result = np.ones(1)
+    while exponent > 0:
+        if exponent & 1:
+            result = np.convolve(result, poly)
+        exponent >>= 1
+        if exponent > 0:
+            poly = np.convolve(poly, poly)
+    return result
+
+
+## Works out the numbers behind a sublevel's spawns, for the functions above.
+#  @param sublevel The P2Sublevel object.
+#  @param deadEnds Number of dead ends the sublevel is assumed to have.
+#  @return A tuple with the list of class names, an array of the minimum
+#  amount of each class, and a list with, for each category with filler,
+#  a tuple of the number of filler spawns, an array with the chance of each
+#  filler entry, and a matrix of how many of each class each filler entry spawns.
+def getFillerModel(sublevel, deadEnds):
+    info = sublevel.info
+    entriesById = {}
+    for e in sublevel.allEntries:
+        entriesById[e.id] = e
+
+    # Give each class a column.
+    classes = []
+    classColumns = {}
+    for e in sublevel.allEntries:
+        c = getEntryClass(e)
+        if c not in classColumns:
+            classColumns[c] = len(classes)
+            classes.append(c)
+
+    # The minimum amounts are the same in every sample.
+    baseCounts = np.zeros(len(classes), dtype=np.int64)
+    for e in sublevel.allEntries:
+        if e.minAmount is not None and e.minAmount > 0:
+            baseCounts[classColumns[getEntryClass(e)]] += e.minAmount
+
+    # For each category with filler, the number of filler spawns, the filler
+    # chances, and a matrix that says which classes each filler entry adds to.
+    fillerCategories = []
+    fillerSpawns = [
+        (p2cpc.CAT_MAIN, info.mainObjectIdealMax - info.mainObjectMinTotal),
+        (p2cpc.CAT_TREASURE, info.treasureObjectIdealMax - info.treasureObjectMinTotal),
+        (p2cpc.CAT_GATE, info.gateObjectIdealMax - info.gateObjectMinTotal),
+        (p2cpc.CAT_DEAD_END, deadEnds - info.deadEndObjectMinTotal),
+    ]
+    for category, nSpawns in fillerSpawns:
+        if nSpawns <= 0 : continue
+        fillers = [f for f in sublevel.getFillerEntries(category) if f.weight is not None and f.weight > 0]
+        if len(fillers) == 0 : continue
+
+        weights = np.array([f.weight for f in fillers], dtype=np.float64)
+        classMatrix = np.zeros((len(fillers), len(classes)), dtype=np.int64)
+        for f in range(len(fillers)):
+            classMatrix[f, classColumns[getEntryClass(fillers[f])]] += 1
+            if fillers[f].carrying is not None:
+                carried = entriesById[fillers[f].carrying]
+                classMatrix[f, classColumns[getEntryClass(carried)]] += 1
+        fillerCategories.append((nSpawns, weights / weights.sum(), classMatrix))
+
+    return classes, baseCounts, fillerCategories
+
+
+## Returns the class name to use for an entry in the simulation results.
+#  @param entry The P2SublevelEntry.
+#  @return The class name.
+def getEntryClass(entry):
+    if entry.objClass is None and entry.category == p2cpc.CAT_GATE:
+        return GATE_CLASS
+    return entry.objClass
+
+
+## Adds two histograms together, even if they have different lengths.
+#  @param a First histogram.
+#  @param b Second histogram.
+#  @return The sum.
+def addHistograms(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    result = a.copy()
+    result[:len(b)] += b
+    return result
+
+
+## Returns the average amount in a histogram from simulateSublevelSpawns().
+#  @param histogram The histogram. It must have at least one sample.
+#  @return The average amount.
+def getHistogramMean(histogram):
+    checkHistogramHasSamples(histogram)
+    return float(np.dot(np.arange(len(histogram)), histogram) / histogram.sum())
+
+
+## Returns the amount at a given percentile of a histogram from simulateSublevelSpawns().
+#  @param histogram The histogram. It must have at least one sample.
+#  @param percent Percentile, from 0 to 100.
+#  @return The smallest amount such that at least that percentage of samples
+#  had that amount or less.
+def getHistogramPercentile(histogram, percent):
+    checkHistogramHasSamples(histogram)
+    cumulative = np.cumsum(histogram)
+    target = cumulative[-1] * percent / 100.0
+    return int(np.searchsorted(cumulative, target, side='left'))
+
+
+## Makes sure a histogram from simulateSublevelSpawns() has at least one sample,
+#  since there's no average or percentile otherwise.
+#  @param histogram The histogram.
+def checkHistogramHasSamples(histogram):
+    if len(histogram) == 0 or histogram.sum() == 0:
+        raise ValueError('The histogram has no samples.')
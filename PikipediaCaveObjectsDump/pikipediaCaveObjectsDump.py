@@ -18,31 +18,62 @@ Next tasks?:
 '''
 
 from email import header
-import io, os, sys
+import concurrent.futures, contextlib, glob, hashlib, io, json, os, stat, sys, tempfile
 import P2CaveParser.p2CaveParser as p2cp
 import P2CaveParser.p2CaveParserCleaner as p2cpc
+import P2CaveParser.p2CaveParserCache as p2cpcache
 import P2CaveParser.constants as constants
 
+# Hash of the code that makes the dump (this script, the parser and the cleaner),
+# for getSublevelFingerprint(). Filled in when first needed.
+dumpCodeStamp = None
+
+# Severity of a diagnostic that means the dump needs manual tweaking.
+SEVERITY_ERROR = 'error'
+# Severity of a diagnostic that's just worth pointing out.
+SEVERITY_NOTE = 'note'
+
 ## 
 #  Main function.
 #  @return -1 in case no argument's been output. 0 on success.
 def main():
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    incremental = '--incremental' in args
+    if incremental:
+        args.remove('--incremental')
+
+    if len(args) < 1:
         print('Pikmin 2 cave object dumper, by Espyo')
-        print('Usage: {0} <input file> [<output file>]'.format(sys.argv[0]))
+        print('Usage: {0} [--incremental] <input file> [<output file>]'.format(sys.argv[0]))
+        print('       {0} [--incremental] <input folder or glob> [<output folder>]'.format(sys.argv[0]))
         print('')
         print('This tool can analyse a Pikmin 2 cave and write exactly how the')
         print('objects are distributed per floor, in a format convenient')
         print('for adding the information to Pikipedia.')
+        print('If given a folder, or a glob like "caveinfo/*.txt", it dumps')
+        print('every cave in it into its own file in the output folder')
+        print('(e.g. "caveinfo/tutorial_1.txt" into "tutorial_1_dump.txt"), and')
+        print('writes an index file with the errors found in each cave.')
+        print('With --incremental, only the sublevels that changed since the')
+        print('last incremental dump are written again.')
         return -1
 
-    inputFn = sys.argv[1]
+    inputFn = args[0]
+
+    if os.path.isdir(inputFn) or glob.has_magic(inputFn):
+        outputDir = 'dump'
+        if len(args) >= 2:
+            outputDir = args[1]
+        if doBatchDump(getBatchInputFilenames(inputFn), outputDir, incremental=incremental) is None:
+            return -1
+        return 0
+
     outputFn = 'dump.txt'
     
-    if len(sys.argv) >= 3:
-        outputFn = sys.argv[2]
+    if len(args) >= 2:
+        outputFn = args[1]
     
-    doDump(inputFn, outputFn)
+    doDump(inputFn, outputFn, incremental=incremental)
 
     return 0
 
@@ -51,42 +82,358 @@ def main():
 #  Start the dumping process.
 #  @param inputFn Input filename.
 #  @param outputFn Output filename.
-def doDump(inputFn, outputFn):
-    inFile = open(inputFn, 'r', errors='ignore')
-    outFile = io.open(outputFn, 'w')
+#  @param quiet If True, don't print a message when it's done.
+#  @param incremental If True, the sublevels whose fingerprint is the same as
+#  in the last incremental dump into the same file are copied from that dump
+#  instead of being written again. See getSublevelFingerprint().
+#  The errors that were found while writing the copied sublevels are
+#  reported again, from what was saved along with their fingerprints.
+#  @param diagnostics DumpDiagnostics object to report errors to. If None,
+#  the errors get printed once the dump is done.
+def doDump(inputFn, outputFn, quiet=False, incremental=False, diagnostics=None):
+    printDiagnostics = diagnostics is None
+    if diagnostics is None:
+        diagnostics = DumpDiagnostics()
+    try:
+        nReused, nSublevels = doDumpCave(inputFn, outputFn, incremental, diagnostics)
+    finally:
+        if printDiagnostics:
+            for l in diagnostics.getLines():
+                print(l)
+
+    if not quiet:
+        if incremental:
+            print(
+                'Finished dumping into "{0}" ({1} of {2} {3} unchanged).'.format(
+                    outputFn, nReused, nSublevels, plural('sublevel', nSublevels)
+                )
+            )
+        else:
+            print('Finished dumping into "{0}".'.format(outputFn))
+
+
+##
+#  Does the work of doDump().
+#  @param inputFn Input filename.
+#  @param outputFn Output filename.
+#  @param incremental Whether to dump incrementally.
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  @return A tuple with how many sublevels were copied from the previous
+#  incremental dump, and how many sublevels there are in total.
+def doDumpCave(inputFn, outputFn, incremental, diagnostics):
+    with open(inputFn, 'r', errors='ignore') as inFile:
+        caveRaw = p2cp.parseCaveFromFile(inFile)
+
+    oldSections = {}
+    if incremental:
+        oldSections = readDumpSections(outputFn)
+    # Whatever fingerprints there were won't match the new dump anymore.
+    # If the dump is incremental, new ones get written once it's done.
+    deleteDumpFingerprints(outputFn)
     
-    caveRaw = p2cp.parseCaveFromFile(inFile)
     cave = p2cpc.P2Cave()
     cave.fromRaw(caveRaw)
-    _, caveFn = os.path.split(inputFn)
-    cave.internalName = caveFn[:-4]
-    if cave.internalName[:3] == 'ch_':
-        cave.caveType = p2cpc.CAVE_TYPE_CHALLENGE
-    elif cave.internalName[:3] == 'vs_':
-        cave.caveType = p2cpc.CAVE_TYPE_BATTLE
-    else:
-        cave.caveType = p2cpc.CAVE_TYPE_STORY
-    preProcessCave(cave)
+    cave.setNameFromFilename(inputFn)
+    diagnostics.caveName = cave.internalName
+    preProcessCave(cave, diagnostics)
     
-    for s in cave.sublevels:
-        outFile.write('-------- Sublevel {0} --------\n'.format(s.number))
-        outFile.write(getSimpleWikiList(cave, s.number - 1))
-        outFile.write('\n')
-        outFile.write('\n')
-        outFile.write(getDetailedWikiList(cave, s.number - 1))
-        outFile.write('\n\n')
-    
-    print('Finished dumping into "{0}".'.format(outputFn))
+    fingerprints = []
+    nReused = 0
+    with openOutputFile(outputFn) as outFile:
+        for s in cave.sublevels:
+            if incremental:
+                fingerprint = getSublevelFingerprint(cave, s)
+                if s.number in oldSections and oldSections[s.number][0] == fingerprint:
+                    _, text, records = oldSections[s.number]
+                    outFile.write(text)
+                    for r in records:
+                        diagnostics.add(r['code'], r['severity'], r['message'], r['sublevel'], r['entry'])
+                    fingerprints.append((s.number, fingerprint, records))
+                    nReused += 1
+                    continue
+
+            nRecordsBefore = len(diagnostics.records)
+            outFile.write('-------- Sublevel {0} --------\n'.format(s.number))
+            writeSimpleWikiList(outFile, cave, s.number - 1, diagnostics)
+            outFile.write('\n')
+            outFile.write('\n')
+            writeDetailedWikiList(outFile, cave, s.number - 1, diagnostics)
+            outFile.write('\n\n')
+            if incremental:
+                fingerprints.append((s.number, fingerprint, diagnostics.records[nRecordsBefore:]))
     
-    inFile.close()
-    outFile.close()
+    if incremental:
+        writeDumpFingerprints(outputFn, fingerprints)
+
+    return (nReused, len(cave.sublevels))
+
+
+##
+#  Opens a file to write a dump into. The text actually goes into a temporary
+#  file in the same folder, which only takes the output's place once everything
+#  is written. If anything goes wrong, the temporary file is deleted, and the
+#  output file is left as it was. The output gets the same permissions as the
+#  file it replaces, or the usual ones for a new file if there wasn't one.
+#  @param outputFn Output filename.
+#  @return A context manager that gives the file to write to.
+@contextlib.contextmanager
+def openOutputFile(outputFn):
+    fd, tempFn = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(outputFn)), prefix='.' + os.path.basename(outputFn) + '.', suffix='.tmp'
+    )
+    try:
+        with io.open(fd, 'w') as outFile:
+            yield outFile
+        try:
+            mode = stat.S_IMODE(os.stat(outputFn).st_mode)
+        except FileNotFoundError:
+            # The only way to read the umask is to set it.
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tempFn, mode)
+        os.replace(tempFn, outputFn)
+    except BaseException:
+        try:
+            os.remove(tempFn)
+        except OSError:
+            pass
+        raise
+
+
+##
+#  Returns a fingerprint of everything that goes into a sublevel's part of the dump:
+#  the sublevel's data, the constants.OBJECTS data of the objects in it,
+#  whatever else about the cave affects it, this script itself, and the
+#  parser and cleaner code that the sublevel's data comes from.
+#  @param cave Cave object, already pre-processed.
+#  @param sublevel The sublevel's P2Sublevel object.
+#  @return The fingerprint, as a string.
+def getSublevelFingerprint(cave, sublevel):
+    global dumpCodeStamp
+    if dumpCodeStamp is None:
+        h = hashlib.sha1(p2cpcache.getParserVersionStamp().encode('ascii'))
+        for fn in (__file__, p2cpc.__file__):
+            with open(fn, 'rb') as sourceFile:
+                h.update(sourceFile.read())
+        dumpCodeStamp = h.hexdigest()
+
+    data = [
+        dumpCodeStamp,
+        cave.caveType,
+        (cave.internalName + ' ' + str(sublevel.number)) in constants.MAX_REQ_CANDYPOPS,
+        sorted(vars(sublevel.info).items()),
+    ]
+    for e in sublevel.allEntries:
+        data.append(tuple(getattr(e, a) for a in p2cpc.P2SublevelEntry.__slots__))
+        if e.objClass is not None:
+            data.append(constants.OBJECTS.get(e.objClass))
+    return hashlib.sha1(repr(data).encode('utf-8')).hexdigest()
+
+
+##
+#  Reads the sublevel sections of a dump written by an incremental doDump(),
+#  along with their fingerprints. A dump that was written without --incremental
+#  has no fingerprints, since doDump() deletes them.
+#  @param outputFn Filename of the dump.
+#  @return A dictionary where each key is a sublevel number (starting at 1), and each
+#  value is a tuple with the fingerprint, the section's text, and the diagnostic
+#  records found while writing the section (see DumpDiagnostics). Empty if there
+#  is no dump, or no fingerprints for it.
+def readDumpSections(outputFn):
+    fingerprintsFn = outputFn + '.fingerprints'
+    if not os.path.isfile(outputFn) or not os.path.isfile(fingerprintsFn):
+        return {}
+
+    fingerprints = {}
+    with io.open(fingerprintsFn, 'r') as fingerprintsFile:
+        for line in fingerprintsFile:
+            words = line.split(None, 2)
+            if len(words) == 3:
+                fingerprints[int(words[0])] = (words[1], json.loads(words[2]))
+
+    sectionLines = {}
+    curLines = None
+    with io.open(outputFn, 'r') as dumpFile:
+        for line in dumpFile:
+            if line.startswith('-------- Sublevel ') and line.endswith(' --------\n'):
+                curLines = []
+                sectionLines[int(line[18:-10])] = curLines
+            if curLines is not None:
+                curLines.append(line)
+
+    if set(sectionLines) != set(fingerprints):
+        # The dump got changed by something else. Don't trust any of it.
+        return {}
+
+    return {
+        nr: (fingerprints[nr][0], ''.join(sectionLines[nr]), fingerprints[nr][1])
+        for nr in sectionLines
+    }
+
+
+##
+#  Writes the fingerprints of a dump's sublevels, next to the dump,
+#  along with the diagnostic records found while writing each sublevel.
+#  @param outputFn Filename of the dump.
+#  @param fingerprints List of (sublevel number, fingerprint, diagnostic records) tuples.
+def writeDumpFingerprints(outputFn, fingerprints):
+    with io.open(outputFn + '.fingerprints', 'w') as fingerprintsFile:
+        for nr, fingerprint, records in fingerprints:
+            fingerprintsFile.write('{0} {1} {2}\n'.format(nr, fingerprint, json.dumps(records)))
+
+
+##
+#  Deletes the fingerprints of a dump's sublevels, if there are any.
+#  @param outputFn Filename of the dump.
+def deleteDumpFingerprints(outputFn):
+    try:
+        os.remove(outputFn + '.fingerprints')
+    except FileNotFoundError:
+        pass
+
+
+##
+#  Returns the list of cave files to dump in batch mode.
+#  @param inputPath A folder, in which case all of its .txt files are used,
+#  except for the ones a batch dump into that same folder would write,
+#  or a glob pattern.
+#  @return The sorted list of filenames.
+def getBatchInputFilenames(inputPath):
+    if os.path.isdir(inputPath):
+        return sorted(
+            fn for fn in glob.glob(os.path.join(inputPath, '*.txt'))
+            if os.path.isfile(fn) and not fn.endswith('_dump.txt') and os.path.basename(fn) != 'index.txt'
+        )
+    return sorted(fn for fn in glob.glob(inputPath) if os.path.isfile(fn))
+
+
+##
+#  Returns the name of the file a cave gets dumped into in batch mode.
+#  @param inputFn Filename of the cave.
+#  @param outputDir Folder the dumps go into.
+#  @return The output filename, like "<outputDir>/<cave name>_dump.txt".
+def getBatchOutputFilename(inputFn, outputDir):
+    name = os.path.splitext(os.path.basename(inputFn))[0]
+    return os.path.join(outputDir, name + '_dump.txt')
+
+
+##
+#  Checks that none of the files a batch dump would write are one of the inputs,
+#  and that no two caves would be dumped into the same file.
+#  Prints what's wrong, if anything.
+#  @param jobs List of jobs for doBatchDumpCave().
+#  @param otherOutputFns List of other files the batch dump writes.
+#  @return True if it's all fine, False otherwise.
+def checkBatchOutputFilenames(jobs, otherOutputFns):
+    def getKey(fn):
+        return os.path.normcase(os.path.realpath(fn))
+
+    inputKeys = set(getKey(job[0]) for job in jobs)
+    outputs = {}
+    ok = True
+    for outputFn, inputFn in [(job[1], job[0]) for job in jobs] + [(fn, None) for fn in otherOutputFns]:
+        key = getKey(outputFn)
+        if key in inputKeys or getKey(outputFn + '.fingerprints') in inputKeys:
+            print('The output file "{0}" would overwrite one of the input files.'.format(outputFn))
+            ok = False
+        elif key in outputs:
+            print('Both "{0}" and "{1}" would be dumped into "{2}".'.format(outputs[key], inputFn, outputFn))
+            ok = False
+        else:
+            outputs[key] = inputFn
+    return ok
+
+
+##
+#  Dumps many caves, each into its own file, using multiple processes.
+#  Whatever errors each cave has are collected separately, and written
+#  into an index file in the output folder, together with the list of dumps.
+#  All of them are also written as JSON lines into "diagnostics.jsonl" in the
+#  output folder, and a summary of how often each one happened gets printed.
+#  @param inputFns List of input filenames.
+#  @param outputDir Folder to write the dumps and the index into.
+#  @param workers Number of processes to use. None to use one per CPU,
+#  1 to do everything in this process.
+#  @param incremental Whether to dump each cave incrementally. See doDump().
+#  @return List of (input filename, output filename, diagnostic records, exception)
+#  tuples, one per cave, in the same order as inputFns. See doBatchDumpCave().
+#  None if nothing was dumped because of a problem with the output filenames.
+#  See checkBatchOutputFilenames().
+def doBatchDump(inputFns, outputDir, workers=None, incremental=False):
+    jobs = [
+        (fn, getBatchOutputFilename(fn, outputDir), incremental)
+        for fn in inputFns
+    ]
+    indexFn = os.path.join(outputDir, 'index.txt')
+    diagnosticsFn = os.path.join(outputDir, 'diagnostics.jsonl')
+    if not checkBatchOutputFilenames(jobs, [indexFn, diagnosticsFn]):
+        return None
+    os.makedirs(outputDir, exist_ok=True)
+
+    if workers == 1:
+        results = [doBatchDumpCave(job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(doBatchDumpCave, jobs))
+
+    allDiagnostics = DumpDiagnostics()
+    with io.open(indexFn, 'w') as indexFile:
+        for inputFn, outputFn, records, exception in results:
+            # The errors found before a cave failed can help explain why, so they're kept too.
+            caveDiagnostics = DumpDiagnostics()
+            caveDiagnostics.records = records
+            allDiagnostics.records.extend(records)
+            if exception is not None:
+                indexFile.write('{0}: FAILED ({1})\n'.format(inputFn, exception))
+            else:
+                indexFile.write('{0}: {1} ({2} {3})\n'.format(inputFn, outputFn, len(records), plural('error', len(records))))
+            for l in caveDiagnostics.getLines():
+                indexFile.write('  {0}\n'.format(l))
+
+    with io.open(diagnosticsFn, 'w') as diagnosticsFile:
+        allDiagnostics.writeJsonLines(diagnosticsFile)
+
+    for l in allDiagnostics.getSummaryLines():
+        print(l)
+
+    nFailed = sum(1 for r in results if r[3] is not None)
+    nErrors = len(allDiagnostics.records)
+    print(
+        'Finished dumping {0} {1} into "{2}", with {3} {4} and {5} failed {6}. See "{7}" for details.'.format(
+            len(results) - nFailed, plural('cave', len(results) - nFailed), outputDir,
+            nErrors, plural('error', nErrors), nFailed, plural('cave', nFailed), indexFn
+        )
+    )
+
+    return results
+
+
+##
+#  Dumps one cave for doBatchDump(), collecting its errors.
+#  @param job Tuple with the input filename, the output filename,
+#  and whether to dump incrementally.
+#  @return A tuple with the input filename, the output filename, the list of
+#  diagnostic records (see DumpDiagnostics), and the exception that stopped
+#  the dump (or None).
+def doBatchDumpCave(job):
+    inputFn, outputFn, incremental = job
+    diagnostics = DumpDiagnostics()
+    exception = None
+    try:
+        doDump(inputFn, outputFn, quiet=True, incremental=incremental, diagnostics=diagnostics)
+    except Exception as e:
+        exception = '{0}: {1}'.format(type(e).__name__, e)
+    return (inputFn, outputFn, diagnostics.records, exception)
 
 
 ##
 #  Does some pre-processing to the cave, like adding some wiki-helpful info
 #  to the existing cave sublevel entry objects.
 #  @param cave Cave object to process.
-def preProcessCave(cave):
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  None to print them right away.
+def preProcessCave(cave, diagnostics=None):
     
     curSublevelNr = 1
 
@@ -149,7 +496,7 @@ def preProcessCave(cave):
                 e.wikiType = data[1]
                 e.wikiDisambig = data[2]
             except KeyError:
-                printSublevelError(curSublevelNr, 'UNKNOWN ENTRY OBJECT CLASS {0}.'.format(e.objClass))
+                reportSublevelError(diagnostics, curSublevelNr, 'UNKNOWN_OBJECT_CLASS', SEVERITY_ERROR, 'UNKNOWN ENTRY OBJECT CLASS {0}.'.format(e.objClass), entryId=e.id)
                 e.wikiName = 'UNKNOWN!{0}'.format(e.objClass)
                 e.wikiType = 'ene'
                 e.wikiDisambig = ''
@@ -160,37 +507,37 @@ def preProcessCave(cave):
             if e.category == p2cpc.CAT_GATE:
                 nGateObjects += 1
                 if e.weight == 0:
-                    printSublevelError(curSublevelNr, 'GATE WITH 0 WEIGHT FOUND! UNSUPPORTED SCENARIO.')
+                    reportSublevelError(diagnostics, curSublevelNr, 'GATE_WITHOUT_WEIGHT', SEVERITY_ERROR, 'GATE WITH 0 WEIGHT FOUND! UNSUPPORTED SCENARIO.', entryId=e.id)
                 if e.minAmount != 0:
-                    printSublevelError(curSublevelNr, 'GATE WITH {0} MIN AMOUNT FOUND! UNSUPPORTED SCENARIO.'.format(e.minAmount))
+                    reportSublevelError(diagnostics, curSublevelNr, 'GATE_WITH_MIN_AMOUNT', SEVERITY_ERROR, 'GATE WITH {0} MIN AMOUNT FOUND! UNSUPPORTED SCENARIO.'.format(e.minAmount), entryId=e.id)
 
         if s.info.mainObjectMinTotal == 0 and s.info.treasureObjectMinTotal == 0:
-            printSublevelError(curSublevelNr, 'THERE ARE NO MINIMUM OBJECTS TO SPAWN. THE DETAILED OBJECT LIST MIGHT LOOK WEIRD WITH AN EMPTY FIRST SECTION. UNSUPPORTED SCENARIO.')
+            reportSublevelError(diagnostics, curSublevelNr, 'NO_MINIMUM_OBJECTS', SEVERITY_ERROR, 'THERE ARE NO MINIMUM OBJECTS TO SPAWN. THE DETAILED OBJECT LIST MIGHT LOOK WEIRD WITH AN EMPTY FIRST SECTION. UNSUPPORTED SCENARIO.')
 
         # Find some weird scenarios that might be worth pointing out or something.
         if s.info.mainObjectMinTotal >= s.info.mainObjectIdealMax and s.info.mainObjectWeightsSum > 0:
-            printSublevelError(curSublevelNr, 'Note: There is no filler room in the main category, but there are main category entries with weight.')
+            reportSublevelError(diagnostics, curSublevelNr, 'MAIN_WEIGHT_WITHOUT_ROOM', SEVERITY_NOTE, 'Note: There is no filler room in the main category, but there are main category entries with weight.')
         if s.info.treasureObjectMinTotal >= s.info.treasureObjectIdealMax and s.info.treasureObjectWeightsSum > 0:
-            printSublevelError(curSublevelNr, 'Note: There is no filler room in the treasure category, but there are treasure category entries with weight.')
+            reportSublevelError(diagnostics, curSublevelNr, 'TREASURE_WEIGHT_WITHOUT_ROOM', SEVERITY_NOTE, 'Note: There is no filler room in the treasure category, but there are treasure category entries with weight.')
         if s.info.gateObjectMinTotal >= s.info.gateObjectIdealMax and s.info.gateObjectWeightsSum > 0:
-            printSublevelError(curSublevelNr, 'Note: There is no filler room in the gate category, but there are gate category entries with weight.')
+            reportSublevelError(diagnostics, curSublevelNr, 'GATE_WEIGHT_WITHOUT_ROOM', SEVERITY_NOTE, 'Note: There is no filler room in the gate category, but there are gate category entries with weight.')
         
         if s.info.mainObjectMinTotal < s.info.mainObjectIdealMax and s.info.mainObjectWeightsSum == 0:
-            printSublevelError(curSublevelNr, 'Note: There is filler room in the main category, but no main category entries with weight.')
+            reportSublevelError(diagnostics, curSublevelNr, 'MAIN_ROOM_WITHOUT_WEIGHT', SEVERITY_NOTE, 'Note: There is filler room in the main category, but no main category entries with weight.')
         if s.info.treasureObjectMinTotal < s.info.treasureObjectIdealMax and s.info.treasureObjectWeightsSum == 0:
-            printSublevelError(curSublevelNr, 'Note: There is filler room in the treasure category, but no treasure category entries with weight.')
+            reportSublevelError(diagnostics, curSublevelNr, 'TREASURE_ROOM_WITHOUT_WEIGHT', SEVERITY_NOTE, 'Note: There is filler room in the treasure category, but no treasure category entries with weight.')
         if s.info.gateObjectMinTotal < s.info.gateObjectIdealMax and s.info.gateObjectWeightsSum == 0:
-            printSublevelError(curSublevelNr, 'Note: There is filler room in the gate category, but no gate category entries with weight.')
+            reportSublevelError(diagnostics, curSublevelNr, 'GATE_ROOM_WITHOUT_WEIGHT', SEVERITY_NOTE, 'Note: There is filler room in the gate category, but no gate category entries with weight.')
         
         if s.info.mainObjectMinTotal > s.info.mainObjectIdealMax:
-            printSublevelError(curSublevelNr, 'Note: There are more minimum objects in the main category than the ideal main category max.')
+            reportSublevelError(diagnostics, curSublevelNr, 'MAIN_MINIMUM_OVER_MAX', SEVERITY_NOTE, 'Note: There are more minimum objects in the main category than the ideal main category max.')
         if s.info.treasureObjectMinTotal > s.info.treasureObjectIdealMax:
-            printSublevelError(curSublevelNr, 'Note: There are more minimum objects in the treasure category than the ideal treasure category max.')
+            reportSublevelError(diagnostics, curSublevelNr, 'TREASURE_MINIMUM_OVER_MAX', SEVERITY_NOTE, 'Note: There are more minimum objects in the treasure category than the ideal treasure category max.')
         if s.info.gateObjectMinTotal > s.info.gateObjectIdealMax:
-            printSublevelError(curSublevelNr, 'Note: There are more minimum objects in the gate category than the ideal gate category max.')
+            reportSublevelError(diagnostics, curSublevelNr, 'GATE_MINIMUM_OVER_MAX', SEVERITY_NOTE, 'Note: There are more minimum objects in the gate category than the ideal gate category max.')
 
         if s.info.gateObjectIdealMax == 0 and nGateObjects > 0:
-            printSublevelError(curSublevelNr, 'Note: {0} gates found, but the sublevel\'s gate object ideal max is 0.'.format(nGateObjects))
+            reportSublevelError(diagnostics, curSublevelNr, 'GATES_WITHOUT_ROOM', SEVERITY_NOTE, 'Note: {0} gates found, but the sublevel\'s gate object ideal max is 0.'.format(nGateObjects))
         
         curSublevelNr += 1
 
@@ -200,8 +547,24 @@ def preProcessCave(cave):
 #  in the specified sublevel index, ready for wiki use.
 #  @param cave Cave object.
 #  @param sublevelNr Sublevel number, starting at 0.
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  None to print them right away.
 #  @return The list.
-def getSimpleWikiList(cave, sublevelNr):
+def getSimpleWikiList(cave, sublevelNr, diagnostics=None):
+    out = io.StringIO()
+    writeSimpleWikiList(out, cave, sublevelNr, diagnostics)
+    return out.getvalue()
+
+
+##
+#  Given a cave object, it writes a simple list of the objects
+#  in the specified sublevel index, ready for wiki use.
+#  @param out File, or file-like object, to write to.
+#  @param cave Cave object.
+#  @param sublevelNr Sublevel number, starting at 0.
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  None to print them right away.
+def writeSimpleWikiList(out, cave, sublevelNr, diagnostics=None):
 
     sublevel = cave.sublevels[sublevelNr]
     
@@ -216,13 +579,13 @@ def getSimpleWikiList(cave, sublevelNr):
         treasureMap[t].min = sublevel.getClassMinimumSpawns(t)
         treasureMap[t].max = sublevel.getClassMaximumSpawns(t)
         if sublevel.doesTreasureHaveMixedCarrying(t):
-            printSublevelError(sublevelNr + 1, 'TREASURE {0} HAS MIXED CARRYING INFORMATION! UNSUPPORTED SCENARIO.'.format(t))
+            reportSublevelError(diagnostics, sublevelNr + 1, 'TREASURE_MIXED_CARRYING', SEVERITY_ERROR, 'TREASURE {0} HAS MIXED CARRYING INFORMATION! UNSUPPORTED SCENARIO.'.format(t))
         if treasureMap[t].min == 0:
-            printSublevelError(sublevelNr + 1, 'TREASURE {0} APPEARS A TOTAL OF 0 TIMES! UNSUPPORTED SCENARIO.'.format(t))
+            reportSublevelError(diagnostics, sublevelNr + 1, 'TREASURE_NEVER_SPAWNS', SEVERITY_ERROR, 'TREASURE {0} APPEARS A TOTAL OF 0 TIMES! UNSUPPORTED SCENARIO.'.format(t))
         if treasureMap[t].carriedBy is not None and \
             sublevel.allEntries[treasureMap[t].carriedBy - 1].weight is not None and \
             sublevel.allEntries[treasureMap[t].carriedBy - 1].weight > 0:
-            printSublevelError(sublevelNr + 1, 'TREASURE {0} IS INSIDE AN ENEMY WITH WEIGHT! UNSUPPORTED SCENARIO.'.format(t))
+            reportSublevelError(diagnostics, sublevelNr + 1, 'TREASURE_INSIDE_FILLER', SEVERITY_ERROR, 'TREASURE {0} IS INSIDE AN ENEMY WITH WEIGHT! UNSUPPORTED SCENARIO.'.format(t))
     
     # Process enemies.
     enemyMap = {}
@@ -284,13 +647,13 @@ def getSimpleWikiList(cave, sublevelNr):
         mititeSourceName = 'inside the Raging Long Legs'
         nMititeSources += 1
     if nMititeSources > 1:
-        printSublevelError(sublevelNr + 1, 'THERE ARE DIFFERENT MITITE SOURCES! CAN\'T FIGURE OUT THE NUMBER OF MITITES. UNSUPPORTED SCENARIO.')
+        reportSublevelError(diagnostics, sublevelNr + 1, 'MULTIPLE_MITITE_SOURCES', SEVERITY_ERROR, 'THERE ARE DIFFERENT MITITE SOURCES! CAN\'T FIGURE OUT THE NUMBER OF MITITES. UNSUPPORTED SCENARIO.')
     
     # Write treasures.
     lines = []
-    result = '* \'\'\'Treasures\'\'\':\n'
+    out.write('* \'\'\'Treasures\'\'\':\n')
     if len(treasureMap) == 0:
-        result += '** None\n'
+        out.write('** None\n')
     else:
         for t in treasureMap:
             l = '** {0}'.format(getIconAndName(t))
@@ -306,38 +669,38 @@ def getSimpleWikiList(cave, sublevelNr):
             if constants.OBJECTS[t][4] == 'r':
                 l += ' \'\'\'!!!!!!!!TODO: ADD OTHER REGIONS!!!!!!!!\'\'\''
             lines.append(l)
-        result = appendSortedLines(lines, result)
+        writeSortedLines(out, lines)
     
     # Write enemies.
     lines = []
-    result += '* \'\'\'Enemies\'\'\':\n'
+    out.write('* \'\'\'Enemies\'\'\':\n')
     if len(enemyMap) == 0 and maxMitites == 0:
-        result += '** None\n'
+        out.write('** None\n')
     else:
         for e in enemyMap:
             l = '** {0} &times; {1}'.format(getIconAndName(e), getTimes(enemyMap[e].min, enemyMap[e].max))
             lines.append(l)
-        result = appendSortedLines(lines, result)
+        writeSortedLines(out, lines)
     
     if maxMitites is None or maxMitites > 0:
-        result += '** {{{{icon|Mitite|y}}}} (group of 10) &times; {0} ({1})\n'.format(getTimes(0, maxMitites), mititeSourceName)
+        out.write('** {{{{icon|Mitite|y}}}} (group of 10) &times; {0} ({1})\n'.format(getTimes(0, maxMitites), mititeSourceName))
     
     # Write obstacles.
     lines = []
-    result += '* \'\'\'Obstacles\'\'\':\n'
+    out.write('* \'\'\'Obstacles\'\'\':\n')
     if len(obstacleMap) == 0:
-        result += '** None\n'
+        out.write('** None\n')
     else:
         for o in obstacleMap:
             l = '** {0} &times; {1}'.format(getIconAndName(o), getTimes(obstacleMap[o].min, obstacleMap[o].max))
             lines.append(l)
-        result = appendSortedLines(lines, result)
+        writeSortedLines(out, lines)
     
     # Write vegetation.
     lines = []
-    result += '* \'\'\'Vegetation\'\'\':\n'
+    out.write('* \'\'\'Vegetation\'\'\':\n')
     if len(vegetationMap) == 0:
-        result += '** None\n'
+        out.write('** None\n')
     else:
         for v in vegetationMap:
             l = '** {0} &times; {1}'.format(getIconAndName(v), getTimes(vegetationMap[v].min, vegetationMap[v].max))
@@ -345,13 +708,13 @@ def getSimpleWikiList(cave, sublevelNr):
                 if (cave.internalName + ' ' + str(sublevelNr + 1)) in constants.MAX_REQ_CANDYPOPS:
                     l += ' (if [[Candypop family#Maximum Pikmin requirement|max Pikmin requirement]] is met)'
             lines.append(l)
-        result = appendSortedLines(lines, result)
+        writeSortedLines(out, lines)
     
     # Write gates and others.
     lines = []
-    result += '* \'\'\'Others\'\'\':\n'
+    out.write('* \'\'\'Others\'\'\':\n')
     if len(otherMap) == 0 and len(gateEntries) == 0:
-        result += '** None\n'
+        out.write('** None\n')
     else:
         for o in otherMap:
             l = '** {0} &times; {1}'.format(getIconAndName(o), getTimes(otherMap[o].min, otherMap[o].max))
@@ -363,9 +726,7 @@ def getSimpleWikiList(cave, sublevelNr):
             else:
                 l += '0 - {0}'.format(sublevel.info.gateObjectIdealMax)
             lines.append(l)
-        result = appendSortedLines(lines, result)
-    
-    return result
+        writeSortedLines(out, lines)
 
 
 ##
@@ -373,8 +734,24 @@ def getSimpleWikiList(cave, sublevelNr):
 #  in the specified sublevel index, ready for wiki use.
 #  @param cave Cave object.
 #  @param sublevelNr Sublevel number, starting at 0.
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  None to print them right away.
 #  @return The list.
-def getDetailedWikiList(cave, sublevelNr):
+def getDetailedWikiList(cave, sublevelNr, diagnostics=None):
+    out = io.StringIO()
+    writeDetailedWikiList(out, cave, sublevelNr, diagnostics)
+    return out.getvalue()
+
+
+##
+#  Given a cave object, it writes a detailed list of the objects
+#  in the specified sublevel index, ready for wiki use.
+#  @param out File, or file-like object, to write to.
+#  @param cave Cave object.
+#  @param sublevelNr Sublevel number, starting at 0.
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  None to print them right away.
+def writeDetailedWikiList(out, cave, sublevelNr, diagnostics=None):
     sublevel = cave.sublevels[sublevelNr]
 
     # Calculate main minimums.
@@ -436,72 +813,70 @@ def getDetailedWikiList(cave, sublevelNr):
             break
     
     # Write header.
-    result = '{| class="wikitable mw-collapsible mw-collapsed technicaltable"\n'
-    result += '! colspan="5" style="width: 288px;" | {{tt|Detailed object list|This is a representation of the data in the cave\'s file, and how the game makes use of it.}}\n'
+    out.write('{| class="wikitable mw-collapsible mw-collapsed technicaltable"\n')
+    out.write('! colspan="5" style="width: 288px;" | {{tt|Detailed object list|This is a representation of the data in the cave\'s file, and how the game makes use of it.}}\n')
 
     # Write main minimums and carried treasure.
     if len(mainMinEntries) == 0:
-        printSublevelError(sublevelNr + 1, 'NO MAIN ENTRIES. UNSUPPORTED SCENARIO. THE DETAILED OBJECT TABLE WILL LOOK WEIRD AND WILL REQUIRE MANUAL TWEAKING.')
+        reportSublevelError(diagnostics, sublevelNr + 1, 'NO_MAIN_ENTRIES', SEVERITY_ERROR, 'NO MAIN ENTRIES. UNSUPPORTED SCENARIO. THE DETAILED OBJECT TABLE WILL LOOK WEIRD AND WILL REQUIRE MANUAL TWEAKING.')
 
-    result += writeDetailedMinHeader('The game spawns these "main" objects:')
+    writeDetailedMinHeader(out, 'The game spawns these "main" objects:')
     for e in mainMinEntries:
-        result += writeDetailedMinEntry(e)
+        writeDetailedMinEntry(out, e, sublevelNr + 1, diagnostics)
     
     # Write main filler.
     if len(mainFillerEntries) > 0 and nMainFillerSpawns > 0:
         
-        result += writeDetailedFillerHeader('Alongside it spawns {0} "main" objects. Chances:'.format(nMainFillerSpawns))
+        writeDetailedFillerHeader(out, 'Alongside it spawns {0} "main" objects. Chances:'.format(nMainFillerSpawns))
         for e in mainFillerEntries:
-            result += writeDetailedFillerEntry(e, sublevel.info.mainObjectWeightsSum)
+            writeDetailedFillerEntry(out, e, sublevel.info.mainObjectWeightsSum, sublevelNr + 1, diagnostics)
     
     # Write decoration minimums.
     if len(decorativeMinEntries) > 0:
 
-        result += writeDetailedMinHeader('Then it spawns these "decoration" objects:')
+        writeDetailedMinHeader(out, 'Then it spawns these "decoration" objects:')
         for e in decorativeMinEntries:
-            result += writeDetailedMinEntry(e)
+            writeDetailedMinEntry(out, e, sublevelNr + 1, diagnostics)
     
     # Write treasure minimums.
     if len(treasureMinEntries) > 0:
 
-        result += writeDetailedMinHeader('Then it spawns these "treasure" objects:')
+        writeDetailedMinHeader(out, 'Then it spawns these "treasure" objects:')
         for e in treasureMinEntries:
-            result += writeDetailedMinEntry(e)
+            writeDetailedMinEntry(out, e, sublevelNr + 1, diagnostics)
     
     # Write treasure filler.
     if len(treasureFillerEntries) > 0 and nTreasureFillerSpawns > 0:
 
-        result += writeDetailedFillerHeader('Then it spawns {0} "treasure" objects. Chances:'.format(nTreasureFillerSpawns))
+        writeDetailedFillerHeader(out, 'Then it spawns {0} "treasure" objects. Chances:'.format(nTreasureFillerSpawns))
         for e in sublevel.allEntries:
-            result += writeDetailedFillerEntry(e, sublevel.info.treasureObjectWeightsSum)
+            writeDetailedFillerEntry(out, e, sublevel.info.treasureObjectWeightsSum, sublevelNr + 1, diagnostics)
 
     # Write dead end minimums.
     if len(deadEndMinEntries) > 0:
 
-        result += writeDetailedMinHeader('Then it spawns these "dead end" objects:')
+        writeDetailedMinHeader(out, 'Then it spawns these "dead end" objects:')
         for e in deadEndMinEntries:
-            result += writeDetailedMinEntry(e)
+            writeDetailedMinEntry(out, e, sublevelNr + 1, diagnostics)
     
     # Write dead end filler.
     if len(deadEndFillerEntries) > 0:
 
-        result += writeDetailedFillerHeader('Then it spawns "dead end" objects in as many dead ends as it can. Chances:')
+        writeDetailedFillerHeader(out, 'Then it spawns "dead end" objects in as many dead ends as it can. Chances:')
         for e in deadEndFillerEntries:
-            result += writeDetailedFillerEntry(e, sublevel.info.deadEndObjectWeightsSum)
+            writeDetailedFillerEntry(out, e, sublevel.info.deadEndObjectWeightsSum, sublevelNr + 1, diagnostics)
 
     # Write gate filler.
     if len(gateFillerEntries) > 0 and sublevel.info.gateObjectIdealMax > 0:
 
-        result += writeDetailedFillerHeader('Then it spawns {0} "gate" objects. Chances:'.format(sublevel.info.gateObjectIdealMax))
+        writeDetailedFillerHeader(out, 'Then it spawns {0} "gate" objects. Chances:'.format(sublevel.info.gateObjectIdealMax))
         for e in gateFillerEntries:
-            result += writeDetailedFillerEntry(e, sublevel.info.gateObjectWeightsSum)
+            writeDetailedFillerEntry(out, e, sublevel.info.gateObjectWeightsSum, sublevelNr + 1, diagnostics)
     
     # Write footer.
-    result += '|}\n'
+    out.write('|}\n')
 
-    result += ':\'\'For details on how objects are spawned, and how some may fail to spawn, see [[Cave#Generation|here]].\'\'\n'
-    
-    return result
+    out.write(':\'\'For details on how objects are spawned, and how some may fail to spawn, see [[Cave#Generation|here]].\'\'\n')
 
 
 ##
@@ -566,94 +941,182 @@ def getTimes(minTimes, maxTimes):
 
 
 ##
-#  Given a string, it adds a list of lines after it, but sorts that list first.
-#  @param list List of lines to add, without the ending '\n'.
-#  @param s String to append the list to.
-#  @return The supplied string with the list appended.
-def appendSortedLines(list, s):
+#  Writes a list of lines, but sorts that list first.
+#  @param out File, or file-like object, to write to.
+#  @param list List of lines to write, without the ending '\n'.
+def writeSortedLines(out, list):
     list = sorted(list)
     for l in list:
-        s += l + '\n'
-    return s
+        out.write(l + '\n')
 
 
 ##
-#  Outputs a processing error in a sublevel.
+#  Reports a processing error in a sublevel.
+#  @param diagnostics DumpDiagnostics object to report it to.
+#  None to print it right away.
 #  @param sublevelNr Sublevel number in which this occurred. Should start at 1.
-#  @param msg Error message to output.
-def printSublevelError(sublevelNr, msg):
-    print('ERROR IN SUBLEVEL {0}: {1}'.format(sublevelNr, msg))
+#  @param code Short code that identifies the kind of error, like 'NO_MAIN_ENTRIES'.
+#  @param severity SEVERITY_ERROR or SEVERITY_NOTE.
+#  @param msg Error message.
+#  @param entryId ID of the entry the error is about, if any.
+def reportSublevelError(diagnostics, sublevelNr, code, severity, msg, entryId=None):
+    if diagnostics is None:
+        print('ERROR IN SUBLEVEL {0}: {1}'.format(sublevelNr, msg))
+        return
+    diagnostics.add(code, severity, msg, sublevelNr, entryId)
+
+
+##
+#  Collects the errors found while dumping, so they can be output all at once
+#  at the end, instead of being printed as they are found.
+#  Each record is a dictionary with the keys 'code', 'severity', 'cave',
+#  'sublevel', 'entry' and 'message'.
+class DumpDiagnostics:
+
+    ##
+    #  Constructor.
+    #  @param self Object pointer.
+    def __init__(self):
+        # List of records.
+        self.records = []
+        # Internal name of the cave being dumped right now.
+        self.caveName = None
+
+
+    ##
+    #  Adds a record.
+    #  @param self Object pointer.
+    #  @param code Short code that identifies the kind of error.
+    #  @param severity SEVERITY_ERROR or SEVERITY_NOTE.
+    #  @param msg Error message.
+    #  @param sublevelNr Sublevel number, starting at 1.
+    #  @param entryId ID of the entry the error is about, if any.
+    def add(self, code, severity, msg, sublevelNr, entryId=None):
+        self.records.append({
+            'code': code,
+            'severity': severity,
+            'cave': self.caveName,
+            'sublevel': sublevelNr,
+            'entry': entryId,
+            'message': msg,
+        })
+
+
+    ##
+    #  Returns the records as human-readable lines.
+    #  @param self Object pointer.
+    #  @return The list of lines.
+    def getLines(self):
+        return [
+            'ERROR IN SUBLEVEL {0}: {1}'.format(r['sublevel'], r['message'])
+            for r in self.records
+        ]
+
+
+    ##
+    #  Writes the records as JSON lines, one record per line.
+    #  @param self Object pointer.
+    #  @param outFile File to write to.
+    def writeJsonLines(self, outFile):
+        for r in self.records:
+            outFile.write(json.dumps(r) + '\n')
+
+
+    ##
+    #  Returns a table with how often each kind of error happened, and in how many caves.
+    #  @param self Object pointer.
+    #  @return The list of lines of the table. Empty if there are no records.
+    def getSummaryLines(self):
+        counts = {}
+        for r in self.records:
+            key = (r['severity'], r['code'])
+            if key not in counts:
+                counts[key] = [0, set()]
+            counts[key][0] += 1
+            counts[key][1].add(r['cave'])
+
+        if len(counts) == 0:
+            return []
+        lines = ['{0:<8} {1:<32} {2:>6} {3:>6}'.format('Severity', 'Code', 'Times', 'Caves')]
+        for severity, code in sorted(counts):
+            times, caves = counts[(severity, code)]
+            lines.append('{0:<8} {1:<32} {2:>6} {3:>6}'.format(severity, code, times, len(caves)))
+        return lines
 
 
 ##
 #  Writes down a "minimum amount" section header for the detailed wiki list.
+#  @param out File, or file-like object, to write to.
 #  @param explanation String explaining what gets spawned in this section.
-#  @return String with the info written.
-def writeDetailedMinHeader(explanation):
-    result = '|-\n'
-    result += '! colspan="5" | {0}\n'.format(explanation)
-    result += '|-\n'
-    result += '! ID !! Object !! Amount !! Fall method !! Spawn location\n'
-    return result
+def writeDetailedMinHeader(out, explanation):
+    out.write('|-\n')
+    out.write('! colspan="5" | {0}\n'.format(explanation))
+    out.write('|-\n')
+    out.write('! ID !! Object !! Amount !! Fall method !! Spawn location\n')
 
 
 ##
 #  Writes down a "filler" section header for the detailed wiki list.
+#  @param out File, or file-like object, to write to.
 #  @param explanation String explaining what gets spawned in this section.
-#  @return String with the info written.
-def writeDetailedFillerHeader(explanation):
-    result = '|-\n'
-    result += '! colspan="5" | {0}\n'.format(explanation)
-    result += '|-\n'
-    result += '! ID !! Object !! Chance !! Fall method !! Spawn location\n'
-    return result
+def writeDetailedFillerHeader(out, explanation):
+    out.write('|-\n')
+    out.write('! colspan="5" | {0}\n'.format(explanation))
+    out.write('|-\n')
+    out.write('! ID !! Object !! Chance !! Fall method !! Spawn location\n')
 
 
 ##
 #  Writes down a "minimum amount" entry's info for the detailed wiki list.
+#  @param out File, or file-like object, to write to.
 #  @param entry The entry to write about.
-#  @return String with the info written.
-def writeDetailedMinEntry(entry):
-    result = ''
+#  @param sublevelNr Number of the entry's sublevel, starting at 1, if known.
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  None to print them right away.
+def writeDetailedMinEntry(out, entry, sublevelNr=None, diagnostics=None):
     if entry.carriedBy is None:
-        result += '|-\n'
-        result += '| {0}\n'.format(entry.id)
-        result += '| {0}\n'.format(getIconAndName(entry.objClass))
-        result += '| {0}\n'.format(entry.minAmount)
-        result += '| {0}\n'.format(getFallMethodStr(entry.spawnMethod))
-        result += '| {0}\n'.format(getSpawnLocationStr(entry))
+        out.write('|-\n')
+        out.write('| {0}\n'.format(entry.id))
+        out.write('| {0}\n'.format(getIconAndName(entry.objClass)))
+        out.write('| {0}\n'.format(entry.minAmount))
+        out.write('| {0}\n'.format(getFallMethodStr(entry.spawnMethod, entry.id, sublevelNr, diagnostics)))
+        out.write('| {0}\n'.format(getSpawnLocationStr(entry, sublevelNr, diagnostics)))
     else:
-        result += '|-\n'
-        result += '| -\n'
-        result += '| {0}\n'.format(getIconAndName(entry.objClass))
-        result += '| colspan="3" | Carried inside entry with ID {0}\n'.format(entry.carriedBy)
-    return result
+        out.write('|-\n')
+        out.write('| -\n')
+        out.write('| {0}\n'.format(getIconAndName(entry.objClass)))
+        out.write('| colspan="3" | Carried inside entry with ID {0}\n'.format(entry.carriedBy))
 
 
 ##
 #  Writes down a "filler" entry's info for the detailed wiki list.
+#  @param out File, or file-like object, to write to.
 #  @param entry The entry to write about.
 #  @param weightSums Sum of the weights of entries of this entry's category.
-#  @return String with the info written.
-def writeDetailedFillerEntry(entry, weightSums):
-    result = '|-\n'
-    result += '| {0}\n'.format(entry.id)
+#  @param sublevelNr Number of the entry's sublevel, starting at 1, if known.
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  None to print them right away.
+def writeDetailedFillerEntry(out, entry, weightSums, sublevelNr=None, diagnostics=None):
+    out.write('|-\n')
+    out.write('| {0}\n'.format(entry.id))
     if entry.category == p2cpc.CAT_GATE:
-        result += '| [[Gate]] ({0:.0f} [[Health|HP]])\n'.format(entry.gateHealth)
+        out.write('| [[Gate]] ({0:.0f} [[Health|HP]])\n'.format(entry.gateHealth))
     else:
-        result += '| {0}\n'.format(getIconAndName(entry.objClass))
-    result += '| {0:.0f}%\n'.format(entry.weight / float(weightSums) * 100)
-    result += '| {0}\n'.format(getFallMethodStr(entry.spawnMethod))
-    result += '| {0}\n'.format(getSpawnLocationStr(entry))
-    
-    return result
+        out.write('| {0}\n'.format(getIconAndName(entry.objClass)))
+    out.write('| {0:.0f}%\n'.format(entry.weight / float(weightSums) * 100))
+    out.write('| {0}\n'.format(getFallMethodStr(entry.spawnMethod, entry.id, sublevelNr, diagnostics)))
+    out.write('| {0}\n'.format(getSpawnLocationStr(entry, sublevelNr, diagnostics)))
 
 
 ##
 #  Returns a string that describes the given fall method.
 #  @param method Fall method.
+#  @param entryId ID of the entry with this fall method, if any.
+#  @param sublevelNr Number of the sublevel with this fall method, starting at 1, if known.
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  None to print them right away.
 #  @return A string describing the fall method.
-def getFallMethodStr(method):
+def getFallMethodStr(method, entryId=None, sublevelNr=None, diagnostics=None):
     if method is None:
         return 'None'
     if method == '$1' or method == '$':
@@ -666,7 +1129,7 @@ def getFallMethodStr(method):
         return 'Falls when Pikmin are carrying nearby'
     if method == '$5':
         return 'Falls if a Purple Pikmin pounds nearby'
-    print('UNKNOWN FALL METHOD {0}'.format(method))
+    reportSublevelError(diagnostics, sublevelNr, 'UNKNOWN_FALL_METHOD', SEVERITY_ERROR, 'UNKNOWN FALL METHOD {0}'.format(method), entryId)
     return ''
 
 
@@ -674,8 +1137,11 @@ def getFallMethodStr(method):
 #  Returns a string that describes an object's spawn location, based on
 #  numerous factors.
 #  @param entry Entry to process.
+#  @param sublevelNr Number of the entry's sublevel, starting at 1, if known.
+#  @param diagnostics DumpDiagnostics object to report errors to.
+#  None to print them right away.
 #  @return A string describing the spawn location.
-def getSpawnLocationStr(entry):
+def getSpawnLocationStr(entry, sublevelNr=None, diagnostics=None):
     if entry.category == p2cpc.CAT_TREASURE:
         return 'Treasure spots'
     if entry.category == p2cpc.CAT_DEAD_END:
@@ -698,7 +1164,11 @@ def getSpawnLocationStr(entry):
         return 'Leader spawn spots'
     if entry.spawnType == 8:
         return '"Special" enemy spots'
-    print('UNKNOWN SPAWN LOCATION FOR ENTRY OF CATEGORY {0} AND SPAWN TYPE {1}'.format(entry.category, entry.spawnType))
+    reportSublevelError(
+        diagnostics, sublevelNr, 'UNKNOWN_SPAWN_LOCATION', SEVERITY_ERROR,
+        'UNKNOWN SPAWN LOCATION FOR ENTRY OF CATEGORY {0} AND SPAWN TYPE {1}'.format(entry.category, entry.spawnType),
+        entry.id
+    )
     return ''
 
 
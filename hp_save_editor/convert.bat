@@ -1 +1 @@
-python3 hp_save_editor.py $1
+python3 hp_save_editor.py %*
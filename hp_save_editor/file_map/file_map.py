@@ -40,12 +40,44 @@ Misc. notes:
 
 
 
+import collections
+import struct
+import types
+
 DATA_UINT8 = 0
 DATA_UINT16 = 1
 DATA_UINT32 = 2
 CHECKSUM_LOCATION = 0xC
 
+# struct format character for each type of data. All data is little-endian.
+DATA_FORMATS = {
+    DATA_UINT8:  "B",
+    DATA_UINT16: "H",
+    DATA_UINT32: "I",
+}
+# Size of each type of data, in bytes.
+DATA_SIZES = {
+    DATA_UINT8:  1,
+    DATA_UINT16: 2,
+    DATA_UINT32: 4,
+}
+# struct.Struct that reads or writes a single piece of data of each type.
+DATA_STRUCTS = dict((t, struct.Struct("<" + f)) for t, f in DATA_FORMATS.items())
+
+# Where a block is in the file, and how to read or write it.
+# offset is where its header magic starts, and size is the size of its data,
+# not counting the header, like in FileMapBlock. codec reads or writes the header
+# and all of the data in one go, and data_names has the name of each piece of data, in order.
+BlockLayout = collections.namedtuple("BlockLayout", ["name", "magic", "offset", "size", "codec", "data_names"])
+# Where a piece of data is in the file, and how to read or write it.
+# offset is from the start of the file, and codec is the type's entry in DATA_STRUCTS.
+FieldLayout = collections.namedtuple("FieldLayout", ["block", "name", "type", "offset", "size", "codec"])
+
+# Fills a FileMap with every block of the save file, and compiles it.
+# Whatever the FileMap had before is cleared first, so this can be called
+# again on the same FileMap.
 def init_file_map(file_map) :
+    file_map.clear()
     file_map.new_block("metadata", "SAVE")
     file_map.register("unk001",   DATA_UINT32)
     file_map.register("unk002",   DATA_UINT32)
@@ -941,25 +973,60 @@ def init_file_map(file_map) :
     file_map.register("unk003", DATA_UINT32)
     file_map.register("unk004", DATA_UINT32)
     file_map.register("unk005", DATA_UINT32)
+    
+    file_map.compile()
 
 class FileMap:
     def __init__(self) :
+        self.clear()
+    
+    # Removes all blocks, and the layout.
+    def clear(self) :
         self.blocks = []
+        self.block_names = set()
+        # FileMapLayout, once compile() is called.
+        self.layout = None
         
     def new_block(self, name, magic) :
+        if name in self.block_names :
+            raise RuntimeError("The file map is malformed! Found two blocks called \"" + name + "\"!")
+        self.block_names.add(name)
         self.blocks.append(FileMapBlock(name, magic))
         
     def register(self, name, type) :
-        for d in self.blocks[-1].data :
-            if d.name == name :
-                raise RuntimeError("The file map is malformed! Found two bits of data called \"" + name + "\" inside block \"" + self.blocks[-1].name + "\"!")
+        if name in self.blocks[-1].data_names :
+            raise RuntimeError("The file map is malformed! Found two bits of data called \"" + name + "\" inside block \"" + self.blocks[-1].name + "\"!")
+        self.blocks[-1].data_names.add(name)
         self.blocks[-1].data.append(FileMapData(name, type))
-        if type == DATA_UINT8 :
-            self.blocks[-1].size = self.blocks[-1].size + 1
-        elif type == DATA_UINT16 :
-            self.blocks[-1].size = self.blocks[-1].size + 2
-        elif type == DATA_UINT32 :
-            self.blocks[-1].size = self.blocks[-1].size + 4
+        self.blocks[-1].size = self.blocks[-1].size + DATA_SIZES[type]
+    
+    # Works out where every block and piece of data is in the file, and
+    # keeps that in self.layout, for the save editor to use from then on.
+    def compile(self) :
+        blocks = []
+        fields = {}
+        offset = 0
+        for b in self.blocks :
+            codec = struct.Struct("<4s" + "".join(DATA_FORMATS[d.type] for d in b.data))
+            blocks.append(BlockLayout(b.name, b.magic, offset, b.size, codec, tuple(d.name for d in b.data)))
+            offset = offset + 4
+            for d in b.data :
+                fields[b.name + "." + d.name] = FieldLayout(b.name, d.name, d.type, offset, DATA_SIZES[d.type], DATA_STRUCTS[d.type])
+                offset = offset + DATA_SIZES[d.type]
+        self.layout = FileMapLayout(tuple(blocks), fields, offset)
+        return self.layout
+
+# Compiled, read-only version of a FileMap. See FileMap.compile().
+class FileMapLayout :
+    def __init__(self, blocks, fields, size) :
+        # Tuple of BlockLayout, in file order.
+        self.blocks = blocks
+        # Each block's BlockLayout, by name.
+        self.blocks_by_name = types.MappingProxyType(dict((b.name, b) for b in blocks))
+        # Each piece of data's FieldLayout, by "block.data" name.
+        self.fields = types.MappingProxyType(fields)
+        # Total size of the file.
+        self.size = size
     
 class FileMapBlock :
     def __init__(self, name, magic) :
@@ -967,6 +1034,7 @@ class FileMapBlock :
         self.magic = magic
         self.size = 0
         self.data = []
+        self.data_names = set()
 
 class FileMapData :
     def __init__(self, name, type) :
@@ -0,0 +1,144 @@
+'''
+Hey! Pikmin save dataset exporter.
+Reads many Hey! Pikmin save files and exports all of their values into one
+NumPy .npz file, so they can be compared across all saves at once.
+Uses the same file map as hp_save_editor.py.
+'''
+
+import glob
+import os
+import sys
+import numpy as np
+from file_map import file_map
+
+fm = file_map.FileMap()
+
+# NumPy type for each type of data. All data is little-endian.
+DTYPE_FORMATS = {
+    file_map.DATA_UINT8:  "u1",
+    file_map.DATA_UINT16: "<u2",
+    file_map.DATA_UINT32: "<u4",
+}
+
+'''
+========================
+Main function.
+'''
+def main() :
+    if len(sys.argv) < 2 :
+        print("Hey! Pikmin save dataset exporter")
+        print("Usage: " + sys.argv[0] + " <input folder or glob> [<output file>]")
+        print("")
+        print("This tool reads many Hey! Pikmin save files (like a folder of 'radish*.sav'")
+        print("snapshots) and exports all of their values into a single NumPy .npz file,")
+        print("with one column per value, so they can be compared across all saves at once.")
+        print("Each column is named after its block and data, like \"options.music_volume\",")
+        print("and the \"filenames\" column has the save file each row came from.")
+        print("For instance: numpy.load(\"saves.npz\")[\"options.music_volume\"]")
+        print("")
+        print("If you don't provide an output file, it'll be \"saves.npz\".")
+        return -1
+
+    input_path = sys.argv[1]
+    output_fn = "saves.npz"
+    if len(sys.argv) >= 3 :
+        output_fn = sys.argv[2]
+
+    file_map.init_file_map(fm)
+
+    input_fns = get_sav_filenames(input_path)
+    if len(input_fns) == 0 :
+        print("No save files found in \"" + input_path + "\". Nothing was exported.")
+        return -1
+
+    saves, loaded_fns, errors = load_sav_dataset(input_fns)
+    for fn, error in errors :
+        print("Could not load " + fn + ": " + error)
+
+    save_sav_dataset(output_fn, saves, loaded_fns)
+    print("Exported " + str(len(saves)) + " saves into " + output_fn + ", " + str(len(errors)) + " failed.")
+
+
+'''
+========================
+Returns the SAV files in a folder, or that match a glob pattern.
+'''
+def get_sav_filenames(input_path) :
+    if os.path.isdir(input_path) :
+        input_path = os.path.join(input_path, "*.sav")
+    return sorted(fn for fn in glob.glob(input_path) if os.path.isfile(fn))
+
+
+'''
+========================
+Returns the NumPy structured type of a whole SAV file, with one field per
+"block.data", at the same offset as in the file. This means a SAV file's bytes
+can be used as-is as an element of this type.
+'''
+def get_sav_dtype() :
+    names = []
+    formats = []
+    offsets = []
+    for f in fm.layout.fields.values() :
+        names.append(f.block + "." + f.name)
+        formats.append(DTYPE_FORMATS[f.type])
+        offsets.append(f.offset)
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": fm.layout.size})
+
+
+'''
+========================
+Reads many SAV files into a NumPy structured array (see get_sav_dtype).
+Returns a tuple with the array, the list of files that were read (one per
+row of the array), and a list of (file name, error) tuples for the files
+that could not be read.
+'''
+def load_sav_dataset(fns) :
+    saves = np.zeros(len(fns), dtype = get_sav_dtype())
+    # The same memory as saves, but as one row of bytes per save.
+    rows = saves.view(np.uint8).reshape(len(fns), fm.layout.size)
+    headers = [(b.offset, b.magic.encode("ascii")) for b in fm.layout.blocks]
+
+    loaded_fns = []
+    errors = []
+    for fn in fns :
+        with open(fn, "rb") as input :
+            raw = input.read()
+
+        if len(raw) < fm.layout.size :
+            errors.append((fn, "It has " + str(len(raw)) + " bytes, but a save file should have at least " + str(fm.layout.size) + "."))
+            continue
+        bad_header = None
+        for offset, magic in headers :
+            if raw[offset : offset + 4] != magic :
+                bad_header = (offset, magic)
+                break
+        if bad_header is not None :
+            errors.append((
+                fn,
+                "In byte " + hex(bad_header[0] + 4) + ", expected block header \"" + bad_header[1].decode("ascii") +
+                "\", found \"" + raw[bad_header[0] : bad_header[0] + 4].decode("ascii", "replace") + "\"."
+            ))
+            continue
+
+        rows[len(loaded_fns)] = np.frombuffer(raw, dtype = np.uint8, count = fm.layout.size)
+        loaded_fns.append(fn)
+
+    return (saves[:len(loaded_fns)], loaded_fns, errors)
+
+
+'''
+========================
+Writes an array from load_sav_dataset into an .npz file, with each column
+stored separately, so that one column can be loaded without the others.
+'''
+def save_sav_dataset(output_fn, saves, fns) :
+    columns = dict((name, saves[name]) for name in saves.dtype.names)
+    np.savez(output_fn, filenames = np.array(fns), **columns)
+
+
+'''
+========================
+'''
+if __name__=="__main__":
+    main()
@@ -1,10 +1,17 @@
 #TODO test the checksum
 #TODO all of the unknown fields
 
+import concurrent.futures
+import contextlib
+import glob
 import io
 import json
+import mmap
+import os
+import stat
 import struct
 import sys
+import tempfile
 from zlib import crc32
 from file_map import file_map
 
@@ -15,12 +22,40 @@ fm = file_map.FileMap()
 Main function.
 '''
 def main() :
+    if len(sys.argv) >= 3 and sys.argv[1] == "--get" :
+        file_map.init_file_map(fm)
+        values = read_sav_fields(sys.argv[2], sys.argv[3:])
+        for name in sys.argv[3:] :
+            print(name + " = " + str(values[name]))
+        return 0
+    
+    if len(sys.argv) >= 3 and sys.argv[1] == "--set" :
+        file_map.init_file_map(fm)
+        values = {}
+        for arg in sys.argv[3:] :
+            name, equals, value = arg.partition("=")
+            if equals == "" :
+                print("Expected something like \"options.music_volume=5\", found \"" + arg + "\".")
+                return -1
+            values[name] = value
+        write_sav_fields(sys.argv[2], values)
+        print("Changed " + str(len(values)) + " value(s) in " + sys.argv[2] + " successfully.")
+        return 0
+    
     if len(sys.argv) < 2 :
         print("Hey! Pikmin save editor, by Espyo, with help from Yoshi2")
         print("Usage: " + sys.argv[0] + " <input file> [<output file>]")
+        print("       " + sys.argv[0] + " [--to-json|--to-sav] <input folder or glob> [<output folder>]")
+        print("       " + sys.argv[0] + " --get <SAV file> <block.data> [<block.data>...]")
+        print("       " + sys.argv[0] + " --set <SAV file> <block.data>=<value> [<block.data>=<value>...]")
         print("")
         print("This tool can convert a Hey! Pikmin save file from, and to, a plain JSON text file that can be edited.")
         print("What it does is determined automatically by the input file's extension.")
+        print("If given a folder, or a glob like \"saves/radish*.sav\", it converts all of")
+        print("the SAV files in it into JSON at once, into the output folder if one is given.")
+        print("Use --to-sav to convert all of the JSON files into SAV instead.")
+        print("With --get or --set, it reads or changes only the given values")
+        print("(e.g. \"options.music_volume\") directly in the SAV file instead.")
         print("")
         print("Notes:")
         print("* This was made with Citra save files in mind ('radish*.sav').")
@@ -28,7 +63,31 @@ def main() :
         print("* More info: http://pikmintkb.shoutwiki.com/wiki/Hey!_Pikmin_save_file")
         return -1
     
+    args = sys.argv[1:]
+    batch_sav_to_json = None
+    if args[0] in ("--to-json", "--to-sav") :
+        batch_sav_to_json = (args[0] == "--to-json")
+        args = args[1:]
+        if len(args) < 1 :
+            print("Expected a folder or glob after " + sys.argv[1] + ".")
+            return -1
+    
+    if batch_sav_to_json is not None or os.path.isdir(args[0]) or glob.has_magic(args[0]) :
+        output_dir = None
+        if len(args) >= 2 :
+            output_dir = args[1]
+        if batch_sav_to_json is None :
+            batch_sav_to_json = True
+        jobs = get_batch_jobs(args[0], output_dir, batch_sav_to_json)
+        if jobs is None :
+            return -1
+        if output_dir is not None :
+            os.makedirs(output_dir, exist_ok = True)
+        do_batch(jobs)
+        return 0
+    
     input_fn = sys.argv[1]
+    
     output_fn = ""
     sav_to_json = False
     
@@ -55,31 +114,22 @@ def main() :
 Convert from SAV to JSON.
 '''
 def do_sav_to_json(input_fn, output_fn) :
-    input = open(input_fn, "rb")
-    output = io.open(output_fn, "w", encoding="utf-8")
-    raw = input.read()
+    with open(input_fn, "rb") as input :
+        raw = memoryview(input.read())
+    if len(raw) < fm.layout.size :
+        raise RuntimeError("The file " + input_fn + " has " + str(len(raw)) + " bytes, but a save file should have at least " + str(fm.layout.size) + ".")
     
     blocks = {}
-    i = 0
-    for b in fm.blocks :
-        block = {}
-        blocks[b.name] = block
-        magic = raw[i : i + 4].decode("ascii")
-        i = i + 4
+    for b in fm.layout.blocks :
+        # Read the header and all of the block's data in one go.
+        values = b.codec.unpack_from(raw, b.offset)
+        magic = values[0].decode("ascii")
         if magic != b.magic :
-            raise RuntimeError("In byte " + hex(i) + ", expected block header \"" + b.magic + "\", found \"" + str(magic) + "\".")
-        for d in b.data :
-            if d.type == file_map.DATA_UINT8 :
-                block[d.name] = ba_to_uint8(raw, i)
-                i = i + 1
-            elif d.type == file_map.DATA_UINT16 :
-                block[d.name] = ba_to_uint16(raw, i)
-                i = i + 2
-            elif d.type == file_map.DATA_UINT32 :
-                block[d.name] = ba_to_uint32(raw, i)
-                i = i + 4
+            raise RuntimeError("In byte " + hex(b.offset + 4) + ", expected block header \"" + b.magic + "\", found \"" + str(magic) + "\".")
+        blocks[b.name] = dict(zip(b.data_names, values[1:]))
         
-    json.dump(blocks, output, indent = 4, separators = (",", ": "), sort_keys = True)
+    text = json.dumps(blocks, indent = 4, separators = (",", ": "), sort_keys = True)
+    write_output_file(output_fn, text)
     print("Dump to " + output_fn + " successful.")
 
 
@@ -88,69 +138,252 @@ def do_sav_to_json(input_fn, output_fn) :
 Convert from JSON to SAV.
 '''
 def do_json_to_sav(input_fn, output_fn) :
-    input = open(input_fn, "r", encoding="utf-8")
-    output = io.open(output_fn, "wb")
-    blocks = json.load(input)
+    with open(input_fn, "r", encoding="utf-8") as input :
+        blocks = json.load(input)
     
-    raw = []
-    i = 0
-    for b in fm.blocks :
+    raw = bytearray(fm.layout.size)
+    for b in fm.layout.blocks :
         if b.name not in blocks :
             raise RuntimeError("Could not find block \"" + b.name + "\" in the JSON data.")
         
-        raw.append(b.magic.encode("ascii")[0])
-        raw.append(b.magic.encode("ascii")[1])
-        raw.append(b.magic.encode("ascii")[2])
-        raw.append(b.magic.encode("ascii")[3])
-        i = i + 4
-        for d in b.data :
-            if d.name not in blocks[b.name] :
-                raise RuntimeError("Could not find data \"" + d.name + "\" in block \"" + b.name + "\" in the JSON data.")
-            
-            if d.type == file_map.DATA_UINT8 :
-                uint8_to_ba(raw, blocks[b.name][d.name])
-                i = i + 1
-            elif d.type == file_map.DATA_UINT16 :
-                uint16_to_ba(raw, blocks[b.name][d.name])
-                i = i + 2
-            elif d.type == file_map.DATA_UINT32 :
-                uint32_to_ba(raw, blocks[b.name][d.name])
-                i = i + 4
+        try :
+            values = [blocks[b.name][name] for name in b.data_names]
+        except KeyError as e :
+            raise RuntimeError("Could not find data \"" + e.args[0] + "\" in block \"" + b.name + "\" in the JSON data.")
+        
+        # Write the header and all of the block's data in one go.
+        b.codec.pack_into(raw, b.offset, b.magic.encode("ascii"), *values)
     
     # Update the checksum.
-    new_chk = crc32(bytearray(raw[file_map.CHECKSUM_LOCATION + 4 : -1]))
-    raw[file_map.CHECKSUM_LOCATION + 0] = struct.pack("I", new_chk)[0]
-    raw[file_map.CHECKSUM_LOCATION + 1] = struct.pack("I", new_chk)[1]
-    raw[file_map.CHECKSUM_LOCATION + 2] = struct.pack("I", new_chk)[2]
-    raw[file_map.CHECKSUM_LOCATION + 3] = struct.pack("I", new_chk)[3]
-    
-    output.write(bytearray(raw))
-    output.close()
+    new_chk = crc32(memoryview(raw)[file_map.CHECKSUM_LOCATION + 4 : -1])
+    struct.pack_into("<I", raw, file_map.CHECKSUM_LOCATION, new_chk)
+    
+    write_output_file(output_fn, raw)
     print("Saved " + output_fn + " successfully.")
 
 
 '''
 ========================
-Utils.
+Writes a converted file, as text if data is a string, or as binary otherwise.
+The data goes into a temporary file first, which then takes the output's place,
+so if anything goes wrong, the output file is either left as it was,
+or not created at all, instead of being left half-written.
+The output gets the same permissions as the file it replaces, or the usual
+ones for a new file if there wasn't one.
+'''
+def write_output_file(output_fn, data) :
+    output_dir = os.path.dirname(os.path.abspath(output_fn))
+    fd, temp_fn = tempfile.mkstemp(dir = output_dir, prefix = "." + os.path.basename(output_fn) + ".", suffix = ".tmp")
+    try :
+        if isinstance(data, str) :
+            output = io.open(fd, "w", encoding="utf-8")
+        else :
+            output = io.open(fd, "wb")
+        with output :
+            output.write(data)
+        os.chmod(temp_fn, get_output_file_mode(output_fn))
+        os.replace(temp_fn, output_fn)
+    except BaseException :
+        with contextlib.suppress(OSError) :
+            os.remove(temp_fn)
+        raise
+
+
+'''
+========================
+Returns the permissions an output file should have: the same as the file
+that's there already, if any, or the ones a newly created file would get.
+'''
+def get_output_file_mode(output_fn) :
+    try :
+        return stat.S_IMODE(os.stat(output_fn).st_mode)
+    except FileNotFoundError :
+        # The only way to read the umask is to set it.
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+'''
+========================
+Returns the conversions to do for a folder or a glob pattern, as a list of
+tuples with the input file name, the output file name, and whether it's
+SAV to JSON (or the other way around). Only SAV files are converted if
+sav_to_json is True, and only JSON files otherwise, so a file written by one
+batch run is never picked up as an input by the next one. The output file has
+the same name with the other extension, in output_dir, or in the same folder
+if that's None. If two outputs would have the same name, or an output would
+be one of the inputs, this prints what's wrong and returns None.
 '''
-def ba_to_uint8(a, i) :
-    return struct.unpack("B", a[i : i + 1])[0]
-def ba_to_uint16(a, i) :
-    return struct.unpack("<H", a[i : i + 2])[0]
-def ba_to_uint32(a, i) :
-    return struct.unpack("<I", a[i : i + 4])[0]
-
-def uint8_to_ba(a, v) :
-    a.append(struct.pack("B", v)[0])
-def uint16_to_ba(a, v) :
-    a.append(struct.pack("<H", v)[0])
-    a.append(struct.pack("<H", v)[1])
-def uint32_to_ba(a, v) :
-    a.append(struct.pack("<I", v)[0])
-    a.append(struct.pack("<I", v)[1])
-    a.append(struct.pack("<I", v)[2])
-    a.append(struct.pack("<I", v)[3])
+def get_batch_jobs(input_path, output_dir, sav_to_json) :
+    if os.path.isdir(input_path) :
+        input_path = os.path.join(input_path, "*")
+    
+    input_ext, output_ext = (".sav", ".json") if sav_to_json else (".json", ".sav")
+    
+    jobs = []
+    for fn in sorted(glob.glob(input_path)) :
+        if not os.path.isfile(fn) :
+            continue
+        base, ext = os.path.splitext(os.path.basename(fn))
+        if ext.lower() != input_ext :
+            continue
+        fn_dir = output_dir if output_dir is not None else os.path.dirname(fn)
+        jobs.append((fn, os.path.join(fn_dir, base + output_ext), sav_to_json))
+    
+    input_fns = set(os.path.normcase(os.path.realpath(j[0])) for j in jobs)
+    output_fns = {}
+    ok = True
+    for j in jobs :
+        output_fn = os.path.normcase(os.path.realpath(j[1]))
+        if output_fn in input_fns :
+            print("Converting " + j[0] + " would overwrite the input file " + j[1] + ".")
+            ok = False
+        elif output_fn in output_fns :
+            print("Both " + output_fns[output_fn] + " and " + j[0] + " would be converted into " + j[1] + ".")
+            ok = False
+        else :
+            output_fns[output_fn] = j[0]
+    
+    return jobs if ok else None
+
+
+'''
+========================
+Does many conversions at once, using multiple processes.
+A file that fails to convert is reported, and the others keep going.
+'''
+def do_batch(jobs, workers = None) :
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = init_batch_worker) as executor :
+        errors = list(executor.map(do_batch_job, jobs, chunksize = 8))
+    
+    n_failed = 0
+    for job, error in zip(jobs, errors) :
+        if error is not None :
+            print("Could not convert " + job[0] + ": " + error)
+            n_failed = n_failed + 1
+    
+    print("Converted " + str(len(jobs) - n_failed) + " files, " + str(n_failed) + " failed.")
+
+
+'''
+========================
+Gets a batch worker process ready, by building the file map once.
+'''
+def init_batch_worker() :
+    file_map.init_file_map(fm)
+
 
+'''
+========================
+Does one batch conversion. Returns None on success,
+or a string describing what went wrong.
+'''
+def do_batch_job(job) :
+    input_fn, output_fn, sav_to_json = job
+    try :
+        with contextlib.redirect_stdout(io.StringIO()) :
+            if sav_to_json :
+                do_sav_to_json(input_fn, output_fn)
+            else :
+                do_json_to_sav(input_fn, output_fn)
+    except Exception as e :
+        return type(e).__name__ + ": " + str(e)
+    return None
+
+
+'''
+========================
+Reads some values straight from a SAV file, without converting the whole file.
+field_names is a list of "block.data" names, like "options.music_volume".
+Returns a dictionary with the value of each one.
+'''
+def read_sav_fields(sav_fn, field_names) :
+    fields = [get_field_layout(n) for n in field_names]
+    values = {}
+    with open(sav_fn, "rb") as input :
+        check_sav_size(sav_fn, input)
+        raw = mmap.mmap(input.fileno(), 0, access = mmap.ACCESS_READ)
+        try :
+            for f in fields :
+                check_block_magic(raw, f.block)
+                values[f.block + "." + f.name] = f.codec.unpack_from(raw, f.offset)[0]
+        finally :
+            raw.close()
+    return values
+
+
+'''
+========================
+Changes some values straight in a SAV file, without converting the whole file,
+and updates the checksum. values is a dictionary where each key is a "block.data"
+name, like "options.music_volume", and each value is the number to write there.
+The number can also be a string, like "5" or "0x1F", as written on the command line.
+'''
+def write_sav_fields(sav_fn, values) :
+    # Pack everything first, so a bad value doesn't leave the file half-changed.
+    changes = []
+    for name, value in values.items() :
+        f = get_field_layout(name)
+        try :
+            if isinstance(value, str) :
+                value = int(value, 0)
+            changes.append((f, f.codec.pack(value)))
+        except (ValueError, struct.error) as e :
+            raise RuntimeError("Invalid value " + str(value) + " for data \"" + name + "\": " + str(e) + ".")
+    
+    with open(sav_fn, "r+b") as output :
+        check_sav_size(sav_fn, output)
+        raw = mmap.mmap(output.fileno(), 0, access = mmap.ACCESS_WRITE)
+        try :
+            for f, packed in changes :
+                check_block_magic(raw, f.block)
+            for f, packed in changes :
+                raw[f.offset : f.offset + f.size] = packed
+            
+            # Update the checksum.
+            new_chk = crc32(raw[file_map.CHECKSUM_LOCATION + 4 : fm.layout.size - 1])
+            struct.pack_into("<I", raw, file_map.CHECKSUM_LOCATION, new_chk)
+            raw.flush()
+        finally :
+            raw.close()
+
+
+'''
+========================
+Returns the file map layout of a piece of data, given its "block.data" name.
+'''
+def get_field_layout(name) :
+    if name not in fm.layout.fields :
+        raise RuntimeError("Unknown data \"" + name + "\". Names look like \"options.music_volume\".")
+    return fm.layout.fields[name]
+
+
+'''
+========================
+Makes sure a SAV file is big enough for the file map.
+'''
+def check_sav_size(sav_fn, file) :
+    size = os.fstat(file.fileno()).st_size
+    if size < fm.layout.size :
+        raise RuntimeError("The file " + sav_fn + " has " + str(size) + " bytes, but a save file should have at least " + str(fm.layout.size) + ".")
+
+
+'''
+========================
+Makes sure a block's header in a SAV file is what it should be.
+'''
+def check_block_magic(raw, block_name) :
+    b = fm.layout.blocks_by_name[block_name]
+    magic = raw[b.offset : b.offset + 4].decode("ascii", "replace")
+    if magic != b.magic :
+        raise RuntimeError("In byte " + hex(b.offset + 4) + ", expected block header \"" + b.magic + "\", found \"" + magic + "\".")
+
+
+'''
+========================
+Utils.
+'''
 def read_uint32(f) :
     return struct.unpack(">I", f.read(4))[0]
 def read_uint16(f) :
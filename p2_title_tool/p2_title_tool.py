@@ -1,6 +1,10 @@
-import os, sys
+import concurrent.futures, contextlib, io, os, stat, sys, tempfile, time
+import numpy as np
 from PIL import Image
 
+# How often to check the files for changes in watch mode, in seconds.
+WATCH_INTERVAL = 0.5
+
 '''
 ========================
 Does the PNG to text file operation.
@@ -20,50 +24,51 @@ def do_png_to_txt(input_fn, output_fn) :
     
     # Image size.
     size = input.size
-    # List of Pikmin, for each of the five types.
+    # All pixels at once, as rows of channels. Only the first three channels matter.
+    pixels = np.asarray(input)
+    red = pixels[:, :, 0]
+    green = pixels[:, :, 1]
+    blue = pixels[:, :, 2]
+    
+    # Which pixels are dots of each of the five types.
+    masks = [
+        # Blue dot means type 0.
+        (red == 0) & (green == 0) & (blue == 255),
+        # Red dot means type 1.
+        (red == 255) & (green == 0) & (blue == 0),
+        # Yellow dot means type 2.
+        (red == 255) & (green == 255) & (blue == 0),
+        # Purple dot means type 3.
+        (red == 255) & (green == 0) & (blue == 255),
+        # White dot means type 4.
+        (red == 255) & (green == 255) & (blue == 255),
+    ]
+    
+    # List of Pikmin, for each of the five types, as a list of X coordinates and
+    # a list of Y coordinates, going through the image row by row. 0,0 is the image center.
     pikmin = []
     for t in range(5) :
-        pikmin.append([])
-    
-    for y in range(size[1]) :
-        for x in range(size[0]) :
-            p = input.getpixel((x, y))
-            t = -1
-            if p[0] == 0 and p[1] == 0 and p[2] == 255 :
-                # Blue dot means type 0.
-                t = 0
-            elif p[0] == 255 and p[1] == 0 and p[2] == 0 :
-                # Red dot means type 1.
-                t = 1
-            elif p[0] == 255 and p[1] == 255 and p[2] == 0 :
-                # Yellow dot means type 2.
-                t = 2
-            elif p[0] == 255 and p[1] == 0 and p[2] == 255 :
-                # Purple dot means type 3.
-                t = 3
-            elif p[0] == 255 and p[1] == 255 and p[2] == 255 :
-                # White dot means type 4.
-                t = 4
-            
-            if t != -1 :
-                # If this is a colored dot, add to the list of Pikmin. 0,0 is the image center.
-                pikmin[t].append((x - size[0] / 2, y - size[1] / 2))
+        ys, xs = np.nonzero(masks[t])
+        pikmin.append(((xs - size[0] / 2).tolist(), (ys - size[1] / 2).tolist()))
     
-    output = open(output_fn, "wb")
-    result_str = ""
+    result_str = []
     
     for t in range(5) :
         # Start by typing how many Pikmin of this type there are.
-        result_str += str(len(pikmin[t])) + " "
-        for p in range(len(pikmin[t])) :
+        result_str.append(str(len(pikmin[t][0])) + " ")
+        for x, y in zip(pikmin[t][0], pikmin[t][1]) :
             # Coordinates of the Pikmin. Note that in P2, less Y means down, so we have to invert.
-            result_str += str(pikmin[t][p][0]) + " " + str(-pikmin[t][p][1]) + " "
+            result_str.append(str(x) + " " + str(-y) + " ")
+    
+    result_bytes = bytes("".join(result_str), encoding="utf-8")
     
-    output.write(bytes(result_str, encoding="utf-8"))
-    output.close()
+    def write_txt(temp_fn) :
+        with open(temp_fn, "wb") as output :
+            output.write(result_bytes)
+    write_output_file(output_fn, write_txt)
     
     for t in range(5) :
-        if len(pikmin[t]) > 100 :
+        if len(pikmin[t][0]) > 100 :
             print(
                 "WARNING: There are more than 100 " +
                 ("Blue" if t == 0 else "Red" if t == 1 else "Yellow" if t == 2 else "Purple" if t == 3 else "White") +
@@ -74,8 +79,8 @@ def do_png_to_txt(input_fn, output_fn) :
             )
     
     print(
-        "Successfully mapped " + str(len(pikmin[0])) + ", " + str(len(pikmin[1])) + ", " +
-        str(len(pikmin[2])) + ", " + str(len(pikmin[3])) + ", and " + str(len(pikmin[4])) +
+        "Successfully mapped " + str(len(pikmin[0][0])) + ", " + str(len(pikmin[1][0])) + ", " +
+        str(len(pikmin[2][0])) + ", " + str(len(pikmin[3][0])) + ", and " + str(len(pikmin[4][0])) +
         " Pikmin into \"" + output_fn + "\"."
     )
 
@@ -85,45 +90,64 @@ def do_png_to_txt(input_fn, output_fn) :
 Text file to PNG.
 '''
 def do_txt_to_png(input_fn, output_fn) :
+    pikmin = read_txt_pikmin(input_fn)
+    pixels = draw_pikmin(pikmin)
+    
+    output = Image.frombuffer("RGBA", (pixels.shape[1], pixels.shape[0]), pixels, "raw", "RGBA", 0, 1)
+    write_output_file(output_fn, output.save)
+    
+    print("Successfully drew " + str(len(pikmin[0][0])) + ", " + str(len(pikmin[1][0])) + ", " + str(len(pikmin[2][0])) + ", " +
+        str(len(pikmin[3][0])) + ", and " + str(len(pikmin[4][0])) + " Pikmin into \"" + output_fn + "\".")
+
+
+'''
+========================
+Reads the Pikmin in a text file. Returns a list with, for each of the five
+types, a tuple with an array of X coordinates and an array of Y coordinates.
+The Y coordinates are already inverted, to go downwards like in an image.
+'''
+def read_txt_pikmin(input_fn) :
     try :
         input = open(input_fn, "rb")
     except e:
         print("Invalid text file \"" + input_fn + "\".")
         sys.exit(-1)
     
-    # List of Pikmin, for each of the five types.
+    # List of Pikmin, for each of the five types, as an array of X coordinates
+    # and an array of Y coordinates.
     pikmin = []
-    for t in range(5) :
-        pikmin.append([])
-    # Minimum and maximum found coordinates. Used for determining image size.
-    min_coords = (99999, 99999)
-    max_coords = (-99999, -99999)
     
     words = input.read().split()
     cur_word = 0
     
     for t in range(5) :
         # Start with the word that defines how many Pikmin of this type there are.
-        word = words[cur_word]
+        type_total = int(words[cur_word])
         cur_word += 1
-        type_total = int(word)
-        cur_point = (0, 0)
         
-        for p in range(type_total) :
-            word = words[cur_word]
-            cur_word += 1
-            cur_point = (float(word), cur_point[1])
-            min_coords = (min(min_coords[0], cur_point[0]), min_coords[1])
-            max_coords = (max(max_coords[0], cur_point[0]), max_coords[1])
-            
-            word = words[cur_word]
-            cur_word += 1
-            # Coordinates of the Pikmin. Note that in P2, less Y means down, so we have to invert.
-            cur_point = (cur_point[0], -float(word))
-            min_coords = (min_coords[0], min(min_coords[1], cur_point[1]))
-            max_coords = (max_coords[0], max(max_coords[1], cur_point[1]))
-            
-            pikmin[t].append(cur_point)
+        # Then come the X and Y of each Pikmin, one after the other.
+        coords = np.fromiter(
+            map(float, words[cur_word:cur_word + type_total * 2]), dtype=np.float64, count=type_total * 2
+        )
+        cur_word += type_total * 2
+        # Coordinates of the Pikmin. Note that in P2, less Y means down, so we have to invert.
+        pikmin.append((coords[0::2], -coords[1::2]))
+    
+    input.close()
+    return pikmin
+
+
+'''
+========================
+Draws the Pikmin from read_txt_pikmin into an image, with the center of
+the image as 0,0. Returns the pixels, as rows of RGBA values.
+'''
+def draw_pikmin(pikmin) :
+    # Minimum and maximum found coordinates. Used for determining image size.
+    all_x = np.concatenate([p[0] for p in pikmin])
+    all_y = np.concatenate([p[1] for p in pikmin])
+    min_coords = (all_x.min(initial=99999), all_y.min(initial=99999))
+    max_coords = (all_x.max(initial=-99999), all_y.max(initial=-99999))
     
     # Image size. Start by figuring out how much space we'll need considering the center is 0,0.
     half_width = int(max(-min_coords[0], max_coords[0]))
@@ -131,24 +155,189 @@ def do_txt_to_png(input_fn, output_fn) :
     # Add two pixels to the final size, so the pixels at the edges can have space to be put in.
     size = (half_width * 2 + 2, half_height * 2 + 2)
     
-    # Adjust all Pikmin coordinates so they are drawn in the right pixel in the image.
+    # Pixels of the image, as rows of RGBA values. Starts all black.
+    pixels = np.zeros((size[1], size[0], 4), dtype=np.uint8)
+    pixels[:, :, 3] = 255
+    colors = [
+        (0, 0, 255, 255), (255, 0, 0, 255), (255, 255, 0, 255), (255, 0, 255, 255), (255, 255, 255, 255)
+    ]
     for t in range(5) :
-        for p in range(len(pikmin[t])) :
-            pikmin[t][p] = (pikmin[t][p][0] + size[0] / 2, pikmin[t][p][1] + size[1] / 2)
+        # Adjust the Pikmin coordinates so they are drawn in the right pixel in the image.
+        # Types are drawn one after the other, so later types cover earlier ones, like before.
+        xs = (pikmin[t][0] + size[0] / 2).astype(np.int64)
+        ys = (pikmin[t][1] + size[1] / 2).astype(np.int64)
+        pixels[ys, xs] = colors[t]
     
-    output = Image.new("RGBA", size, (0, 0, 0, 255))
-    for t in range(5) :
-        for p in range(len(pikmin[t])) :
-            output.putpixel(
-                (int(pikmin[t][p][0]), int(pikmin[t][p][1])),
-                ((0, 0, 255, 255) if t == 0 else (255, 0, 0, 255) if t == 1 else (255, 255, 0, 255) if t == 2 else
-                (255, 0, 255, 255) if t == 3 else (255, 255, 255, 255))
-            )
+    return pixels
+
+
+'''
+========================
+Returns whether a PNG is exactly what do_txt_to_png would draw from a text file.
+If so, the PNG hasn't been changed since it was made from that text file, and
+converting it back would only lose the precision of the text file's coordinates.
+'''
+def is_drawing_of_txt(png_fn, txt_fn) :
+    try :
+        with Image.open(png_fn) as image :
+            image_pixels = np.asarray(image.convert("RGBA"))
+        with contextlib.redirect_stdout(io.StringIO()) :
+            txt_pixels = draw_pikmin(read_txt_pikmin(txt_fn))
+    except (Exception, SystemExit) :
+        return False
+    return np.array_equal(image_pixels, txt_pixels)
+
+
+'''
+========================
+Writes an output file by calling write_func with the name of a temporary file
+to write to, in the same folder and with the same extension. Once that's done,
+the temporary file takes the output's place, so if anything goes wrong, the
+output file is either left as it was, or not created at all.
+The output gets the same permissions as the file it replaces, or the usual
+ones for a new file if there wasn't one.
+'''
+def write_output_file(output_fn, write_func) :
+    output_dir = os.path.dirname(os.path.abspath(output_fn))
+    fd, temp_fn = tempfile.mkstemp(
+        dir=output_dir, prefix="." + os.path.basename(output_fn) + ".", suffix=".tmp" + os.path.splitext(output_fn)[1]
+    )
+    os.close(fd)
+    try :
+        write_func(temp_fn)
+        os.chmod(temp_fn, get_output_file_mode(output_fn))
+        os.replace(temp_fn, output_fn)
+    except BaseException :
+        with contextlib.suppress(OSError) :
+            os.remove(temp_fn)
+        raise
+
+
+'''
+========================
+Returns the permissions an output file should have: the same as the file
+that's there already, if any, or the ones a newly created file would get.
+'''
+def get_output_file_mode(output_fn) :
+    try :
+        return stat.S_IMODE(os.stat(output_fn).st_mode)
+    except FileNotFoundError :
+        # The only way to read the umask is to set it.
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+'''
+========================
+Does one conversion. Whatever it prints gets returned instead of printed,
+and if it fails, it doesn't stop the program.
+job is a tuple with the input file name, the output file name,
+and whether it's PNG to text file (or the other way around).
+Returns a tuple with the printed text and whether it succeeded.
+'''
+def do_job(job) :
+    input_fn, output_fn, png_to_txt = job
+    messages = io.StringIO()
+    ok = True
+    with contextlib.redirect_stdout(messages) :
+        try :
+            if png_to_txt and os.path.isfile(output_fn) and is_drawing_of_txt(input_fn, output_fn) :
+                print("Skipping \"" + input_fn + "\", since it's an unchanged drawing of \"" + output_fn + "\".")
+            elif png_to_txt :
+                do_png_to_txt(input_fn, output_fn)
+            else :
+                do_txt_to_png(input_fn, output_fn)
+        except SystemExit :
+            ok = False
+        except Exception as e :
+            print("Could not convert \"" + input_fn + "\": " + str(e))
+            ok = False
+    return (messages.getvalue(), ok)
+
+
+'''
+========================
+Returns the conversions to do for the files in a folder, as a list of
+job tuples (see do_job). If png_to_txt is True, PNGs become text files with
+the same name minus the extension. Otherwise, "coordinate_*" text files become
+PNGs with the same name plus ".png". Only one direction is done at a time,
+so the files that one run writes are never converted back by the next, and
+do_job skips PNGs that are still exactly what was drawn from their text file.
+A file whose output would be one of the input files is skipped, and if quiet
+is False, that gets printed.
+'''
+def get_folder_jobs(input_dir, output_dir, png_to_txt=True, quiet=False) :
+    jobs = []
+    for fn in sorted(os.listdir(input_dir)) :
+        full_fn = os.path.join(input_dir, fn)
+        if not os.path.isfile(full_fn) :
+            continue
+        if fn[-4:] == ".png" :
+            if png_to_txt :
+                jobs.append((full_fn, os.path.join(output_dir, fn[:-4]), True))
+        elif fn.startswith("coordinate_") and not png_to_txt :
+            jobs.append((full_fn, os.path.join(output_dir, fn + ".png"), False))
     
-    output.save(output_fn)
+    input_fns = set(os.path.normcase(os.path.realpath(j[0])) for j in jobs)
+    result = []
+    for j in jobs :
+        if os.path.normcase(os.path.realpath(j[1])) in input_fns :
+            if not quiet :
+                print("Skipping \"" + j[0] + "\", since it would overwrite the input file \"" + j[1] + "\".")
+            continue
+        result.append(j)
+    return result
+
+
+'''
+========================
+Does many conversions at once, using multiple processes.
+'''
+def do_batch(jobs, workers=None) :
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor :
+        results = list(executor.map(do_job, jobs))
+    
+    n_failed = 0
+    for messages, ok in results :
+        sys.stdout.write(messages)
+        if not ok :
+            n_failed += 1
+    
+    print("Converted " + str(len(jobs) - n_failed) + " files, " + str(n_failed) + " failed.")
+
+
+'''
+========================
+Keeps converting a PNG, or the PNGs in a folder, into text files
+whenever they change on the disk, until Ctrl+C is pressed.
+'''
+def do_watch(input_fn, output_fn) :
+    # Modification time of each PNG when it was last converted.
+    mtimes = {}
+    print("Watching \"" + input_fn + "\" for changes. Press Ctrl+C to stop.")
     
-    print("Successfully drew " + str(len(pikmin[0])) + ", " + str(len(pikmin[1])) + ", " + str(len(pikmin[2])) + ", " +
-        str(len(pikmin[3])) + ", and " + str(len(pikmin[4])) + " Pikmin into \"" + output_fn + "\".")
+    try :
+        while True :
+            if os.path.isdir(input_fn) :
+                jobs = get_folder_jobs(input_fn, output_fn, png_to_txt=True, quiet=True)
+            else :
+                jobs = [(input_fn, output_fn, True)]
+            
+            for job in jobs :
+                try :
+                    mtime = os.stat(job[0]).st_mtime_ns
+                except OSError :
+                    continue
+                if mtimes.get(job[0]) == mtime :
+                    continue
+                mtimes[job[0]] = mtime
+                sys.stdout.write(do_job(job)[0])
+                sys.stdout.flush()
+            
+            time.sleep(WATCH_INTERVAL)
+    except KeyboardInterrupt :
+        pass
 
 
 '''
@@ -156,9 +345,19 @@ def do_txt_to_png(input_fn, output_fn) :
 Main function.
 '''
 def main() :
-    if len(sys.argv) < 2 :
+    args = sys.argv[1:]
+    watch = "--watch" in args
+    if watch :
+        args.remove("--watch")
+    folder_png_to_txt = "--to-png" not in args
+    for flag in ("--to-txt", "--to-png") :
+        if flag in args :
+            args.remove(flag)
+    
+    if len(args) < 1 :
         print("Pikmin 2 title screen tool, by Espyo")
-        print("Usage: " + sys.argv[0] + " <input file> [<output file>]")
+        print("Usage: " + sys.argv[0] + " [--watch] <input file> [<output file>]")
+        print("       " + sys.argv[0] + " [--watch|--to-txt|--to-png] <input folder> [<output folder>]")
         print("")
         print("This tool helps you create title screen Pikmin formations.")
         print("It allows you to convert an image file (PNG preferably)")
@@ -176,9 +375,34 @@ def main() :
         print("")
         print("If you don't provide an output file, it'll be \"coordinate_eng\"")
         print("if printing to a text file, or \"map.png\" if drawing to an image file.")
+        print("")
+        print("If the input is a folder, every PNG in it gets converted into the")
+        print("output folder (the same folder by default), into a text file with")
+        print("the same name minus the \".png\". This is the default, and can also")
+        print("be asked for with --to-txt. With --to-png, it's the other way")
+        print("around: every \"coordinate_*\" text file in it gets converted into")
+        print("a PNG with the same name plus \".png\".")
+        print("With --watch, the tool keeps running, and converts the PNG")
+        print("(or the PNGs in the folder) again whenever they change.")
         return -1
     
-    input_fn = sys.argv[1]
+    input_fn = args[0]
+    
+    if os.path.isdir(input_fn) :
+        output_dir = input_fn
+        if len(args) >= 2 :
+            output_dir = args[1]
+            if not os.path.isdir(output_dir) :
+                os.makedirs(output_dir)
+        if watch :
+            if not folder_png_to_txt :
+                print("Watch mode only works with PNG files.")
+                return -1
+            do_watch(input_fn, output_dir)
+        else :
+            do_batch(get_folder_jobs(input_fn, output_dir, folder_png_to_txt))
+        return 0
+    
     output_fn = ""
     png_to_txt = False
     
@@ -188,10 +412,15 @@ def main() :
     else :
         output_fn = "map.png"
     
-    if len(sys.argv) >= 3 :
-        output_fn = sys.argv[2]
+    if len(args) >= 2 :
+        output_fn = args[1]
     
-    if png_to_txt :
+    if watch :
+        if not png_to_txt :
+            print("Watch mode only works with PNG files.")
+            return -1
+        do_watch(input_fn, output_fn)
+    elif png_to_txt :
         do_png_to_txt(input_fn, output_fn)
     else :
         do_txt_to_png(input_fn, output_fn)